@@ -0,0 +1,6 @@
+"""
+    Benchmarks for notty.
+
+    Run them from the repository root, e.g. ``python -m benchmarks.startup``,
+    or all of them with ``python -m benchmarks.run``.
+"""
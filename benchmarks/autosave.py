@@ -0,0 +1,109 @@
+"""
+    Autosave benchmark: cost of queueing a save on the UI thread and time
+    for the save queue to write batches of edited notes.
+
+    Every flush writes notes whose texts got a small edit since the last
+    one, like a typing session between two autosaves.
+
+    Usage: python -m benchmarks.autosave [--notes 10000] [--flushes 50] [--json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from benchmarks.generate import data_home_for, make_text, make_vocabulary
+
+# (label, notes written by every flush, characters of every note's text)
+CASES = [
+    ("flush 1 note", 1, None),
+    ("flush 20 notes", 20, None),
+    ("flush 1 MB note", 1, 1024 * 1024),
+]
+
+
+def edited(rng, text):
+    """ Inserts a character into a text, like a key press """
+    position = rng.randrange(len(text) + 1)
+    return text[:position] + "x" + text[position:]
+
+
+async def measure(db, rng, vocab, ids, flushes):
+    from notty.lib.SaveQueue import SaveQueue
+
+    # Flushes are triggered by the benchmark, not by the debounce timer
+    saver = SaveQueue(db, debounce=3600)
+    results = {}
+
+    timings = []
+    for i in range(flushes * 100):
+        start = time.perf_counter()
+        saver.put(ids[i % len(ids)], "text")
+        timings.append(time.perf_counter() - start)
+    for id in ids:
+        saver.discard(id)
+    results["put, s"] = statistics.median(timings)
+
+    for label, count, size in CASES:
+        texts = {}
+        for id in rng.sample(ids, count):
+            text = make_text(rng, vocab)
+            if size:
+                text = (text + "\n") * (size // (len(text) + 1) + 1)
+            texts[id] = text
+        db.update_texts(texts)
+
+        timings = []
+        for _ in range(flushes):
+            for id, text in texts.items():
+                texts[id] = edited(rng, text)
+                saver.put(id, texts[id])
+            start = time.perf_counter()
+            await saver.flush()
+            timings.append(time.perf_counter() - start)
+        results[f"{label}, s"] = statistics.median(timings)
+
+    await saver.close()
+    return results
+
+
+def run(count, flushes, seed=0):
+    rng = random.Random(seed)
+    vocab = make_vocabulary(rng)
+
+    with tempfile.TemporaryDirectory() as root:
+        os.environ["XDG_DATA_HOME"] = data_home_for(root, count, seed)
+
+        from notty.lib.db import Notes
+
+        db = Notes()
+        db.engine.search_index_built.wait()
+        ids = list(range(1, count + 1))
+
+        results = asyncio.run(measure(db, rng, vocab, ids, flushes))
+        db.close_conn()
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--notes", type=int, default=10000)
+    parser.add_argument("--flushes", type=int, default=50)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    results = run(args.notes, args.flushes)
+    if args.json:
+        return print(json.dumps(results))
+
+    for label, seconds in results.items():
+        print(f"{label:>20} {seconds * 1000:>10.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+    CRUD benchmark: throughput of `Notes` operations on a store of a given size.
+
+    Single-note operations run one transaction each, like the editor's
+    saves, batched inserts go through `insert_many()` like imports.
+
+    Usage: python -m benchmarks.crud [--notes 10000] [--ops 1000] [--json]
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.generate import data_home_for, make_text, make_title, make_vocabulary
+
+# Notes per `insert_many()` call of the batched insert
+BATCH_SIZE = 1000
+
+
+def throughput(ops, function):
+    """ Calls `function(i)` for every `i` below `ops`, returns calls per second """
+    start = time.perf_counter()
+    for i in range(ops):
+        function(i)
+    return ops / (time.perf_counter() - start)
+
+
+def run(count, ops, seed=0):
+    rng = random.Random(seed)
+    vocab = make_vocabulary(rng)
+    notes = [(make_title(rng, vocab), make_text(rng, vocab), "ts") for _ in range(ops)]
+
+    with tempfile.TemporaryDirectory() as root:
+        os.environ["XDG_DATA_HOME"] = data_home_for(root, count, seed)
+
+        from notty.lib import db as db_module
+        from notty.lib.db import Notes
+
+        # Every update would be merged into the last revision otherwise
+        db_module.REVISION_INTERVAL = 0
+        db = Notes()
+        # Migrations and indexing of the generated store are not measured
+        db.engine.search_index_built.wait()
+        ids = rng.sample(range(1, count + 1), min(count, ops))
+
+        results = {
+            "insert, /s": throughput(ops, lambda i: db.insert(notes[i])),
+        }
+
+        batches = max(1, ops * 10 // BATCH_SIZE)
+        start = time.perf_counter()
+        for batch in range(batches):
+            db.insert_many(notes[j % ops] for j in range(batch * BATCH_SIZE, (batch + 1) * BATCH_SIZE))
+        results["insert batched, /s"] = batches * BATCH_SIZE / (time.perf_counter() - start)
+
+        results["get, /s"] = throughput(len(ids), lambda i: db.get(ids[i]))
+        results["get_text, /s"] = throughput(len(ids), lambda i: db.get_text(ids[i]))
+        results["update_text, /s"] = throughput(
+            len(ids), lambda i: db.update_text(ids[i], notes[i][1])
+        )
+        results["update_title, /s"] = throughput(
+            len(ids), lambda i: db.update_title(ids[i], notes[i][0])
+        )
+        results["delete, /s"] = throughput(len(ids), lambda i: db.delete(ids[i]))
+
+        db.close_conn()
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--notes", type=int, default=10000)
+    parser.add_argument("--ops", type=int, default=1000)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    results = run(args.notes, args.ops)
+    if args.json:
+        return print(json.dumps(results))
+
+    for label, value in results.items():
+        print(f"{label:>20} {value:>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+    Fuzzy filter benchmark: time spent per keystroke while typing queries
+    over a large set of titles.
+
+    A keystroke costs `set_query()` plus one `step()`, the rest of
+    the matching is spread over the following frames. Every step also
+    rebuilds the sidebar's list of notes from the matches, as the list
+    screen does.
+
+    Usage: python -m benchmarks.fuzzy_filter [--titles 50000] [--json]
+"""
+
+import argparse
+import json
+import random
+import statistics
+import time
+
+from benchmarks.generate import make_title, make_vocabulary
+from notty.lib.FuzzyFilter import FuzzyFilter
+from notty.lib.Note import NoteSummary
+from notty.lib.NoteList import NoteList
+
+QUERIES = ["meeting", "rev", "budget plan", "xq"]
+
+
+def run(count, seed=0):
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary(rng)
+    items = [NoteSummary(i, make_title(rng, vocabulary)) for i in range(count)]
+
+    fuzzy = FuzzyFilter(items)
+    notes = NoteList(None)
+    keystrokes, steps, completions = [], [], []
+
+    def step():
+        done = fuzzy.step()
+        notes.show(fuzzy.matched_items())
+        return done
+
+    for query in QUERIES:
+        # Type the query, then erase it character by character
+        typed = [query[:i] for i in range(1, len(query) + 1)]
+        for text in typed + typed[-2::-1] + [""]:
+            start = time.perf_counter()
+            fuzzy.set_query(text)
+            done = step()
+            keystroke = time.perf_counter() - start
+            keystrokes.append(keystroke)
+
+            elapsed = keystroke
+            while not done:
+                start = time.perf_counter()
+                done = step()
+                steps.append(time.perf_counter() - start)
+                elapsed += steps[-1]
+            completions.append(elapsed)
+
+    return keystrokes, steps, completions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--titles", type=int, default=50000)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    keystrokes, steps, completions = run(args.titles)
+    if args.json:
+        results = {
+            "keystroke median, s": statistics.median(keystrokes),
+            "keystroke max, s": max(keystrokes),
+            "full match median, s": statistics.median(completions),
+        }
+        return print(json.dumps(results))
+    for label, timings in (
+        ("keystroke", keystrokes),
+        ("later step", steps),
+        ("full match", completions),
+    ):
+        if not timings:
+            continue
+        print(
+            f"{label:>12}  median {statistics.median(timings) * 1000:6.2f}ms"
+            f"  max {max(timings) * 1000:6.2f}ms  ({len(timings)} samples)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+    Seeded generator for synthetic note stores.
+
+    Titles have 1-6 words and texts follow a log-normal size distribution
+    (a median of ~400 characters, capped at 256 KiB), with words drawn by
+    Zipf's law, so a store looks like years of real notes. The same count
+    and seed always give the same store.
+
+    Set `NOTTY_BENCH_CACHE` to a directory to keep generated stores there,
+    later runs copy them instead of generating them again.
+"""
+
+from datetime import datetime, timedelta
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+
+WORDS = (
+    "meeting notes todo idea draft plan list review bug fix release shopping "
+    "book movie recipe travel budget call email project design sketch log "
+    "summary question answer research paper server deploy backup weekly daily"
+).split()
+
+SYLLABLES = (
+    "ba be bi bo bu da de di do du ka ke ki ko ku la le li lo lu ma me mi mo "
+    "mu na ne ni no nu ra re ri ro ru sa se si so su ta te ti to tu"
+).split()
+
+# Words of the synthetic language, their frequencies follow Zipf's law
+VOCABULARY_SIZE = 20000
+
+# Environment variable with a directory of generated stores kept between runs
+CACHE_ENV = "NOTTY_BENCH_CACHE"
+
+SCHEMA = """CREATE TABLE IF NOT EXISTS notes
+    (id INTEGER PRIMARY KEY AUTOINCREMENT, title text NOT_NULL, text text NOT_NULL, ts text NOT_NULL);
+"""
+
+
+def make_vocabulary(rng, size=VOCABULARY_SIZE):
+    """ Returns `(words, cumulative weights)`, the most frequent words first """
+    words = list(WORDS)
+    seen = set(words)
+    while len(words) < size:
+        word = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+
+    weights = []
+    total = 0
+    for rank in range(size):
+        total += 1 / (rank + 1)
+        weights.append(total)
+    return words, weights
+
+
+def make_title(rng, vocabulary):
+    words = rng.choices(vocabulary[0], cum_weights=vocabulary[1], k=rng.randint(1, 6))
+    return " ".join(words).capitalize()
+
+
+def make_text(rng, vocabulary):
+    # Most notes are short, a few are long pasted dumps
+    size = int(min(rng.lognormvariate(6, 1.2), 256 * 1024))
+    words = rng.choices(vocabulary[0], cum_weights=vocabulary[1], k=size // 6 + 1)
+
+    lines = []
+    start = 0
+    while start < len(words):
+        end = start + rng.randint(0, 14)
+        lines.append(" ".join(words[start:end]))
+        start = end if end > start else start + 1
+    return "\n".join(lines)
+
+
+def generate_notes(count, seed=0):
+    """ Yields `count` reproducible `(title, text, ts)` tuples """
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary(rng)
+    start = datetime(2019, 1, 1)
+
+    for i in range(count):
+        ts = start + timedelta(minutes=i * 7 + rng.randint(0, 6))
+        yield make_title(rng, vocabulary), make_text(rng, vocabulary), ts.strftime("%c")
+
+
+def generate_store(path, count, seed=0):
+    """ Creates a note store at `path` filled with `count` notes """
+    if os.path.exists(path):
+        os.remove(path)
+
+    connection = sqlite3.connect(path)
+    connection.execute(SCHEMA)
+    with connection:
+        connection.executemany(
+            "INSERT INTO notes (title, text, ts) VALUES (?, ?, ?);",
+            generate_notes(count, seed),
+        )
+    connection.close()
+    return path
+
+
+def data_home_for(root, count, seed=0):
+    """
+    Creates a store inside `root` laid out like the user data dir
+    (`$XDG_DATA_HOME/notty/main.db`) and returns that data home.
+    """
+    data_home = os.path.join(root, f"notes-{count}-{seed}")
+    os.makedirs(os.path.join(data_home, "notty"), exist_ok=True)
+    path = os.path.join(data_home, "notty", "main.db")
+
+    cache = os.environ.get(CACHE_ENV)
+    if not cache:
+        generate_store(path, count, seed)
+        return data_home
+
+    cached = os.path.join(cache, f"notes-{count}-{seed}.db")
+    if not os.path.exists(cached):
+        os.makedirs(cache, exist_ok=True)
+        # Generated under a temporary name, so an interrupted run leaves no partial store
+        generate_store(cached + ".tmp", count, seed)
+        os.replace(cached + ".tmp", cached)
+    shutil.copyfile(cached, path)
+    return data_home
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic note store")
+    parser.add_argument("path")
+    parser.add_argument("--count", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    generate_store(args.path, args.count, args.seed)
@@ -0,0 +1,109 @@
+"""
+    Revision history benchmark: storage taken by delta-encoded revisions
+    against full copies of every saved version, and time to restore them.
+
+    Every save makes a few small edits to a note, like a typing session
+    between two autosaves. Merging of close saves is off, so every save
+    becomes a revision, which is the worst case for storage.
+
+    Usage: python -m benchmarks.history [--notes 100] [--saves 100]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+import zlib
+
+from benchmarks.generate import make_text, make_vocabulary
+
+
+def edit(rng, vocab, text):
+    """ Changes, inserts or removes a few lines of a text """
+    lines = text.splitlines(keepends=True) or ["\n"]
+    for _ in range(rng.randint(1, 3)):
+        index = rng.randrange(len(lines))
+        action = rng.random()
+        if action < 0.5:
+            lines[index] = make_text(rng, vocab).split("\n")[0] + "\n"
+        elif action < 0.8:
+            lines.insert(index, make_text(rng, vocab).split("\n")[0] + "\n")
+        elif len(lines) > 1:
+            del lines[index]
+    return "".join(lines)
+
+
+def run(count, saves, seed=0):
+    import notty.lib.db as db_module
+    from notty.lib.db import Engine, Notes
+
+    db_module.REVISION_INTERVAL = 0
+    rng = random.Random(seed)
+    vocab = make_vocabulary(rng)
+
+    with tempfile.TemporaryDirectory() as root:
+        db = Notes(Engine(os.path.join(root, "main.db")))
+        full_copies = full_copies_zlib = 0
+
+        ids = []
+        start = time.perf_counter()
+        for _ in range(count):
+            text = make_text(rng, vocab)
+            id = db.insert(("note", text, "ts"))
+            ids.append(id)
+            for _ in range(saves):
+                full_copies += len(text.encode("utf-8"))
+                full_copies_zlib += len(zlib.compress(text.encode("utf-8")))
+                text = edit(rng, vocab, text)
+                db.update_text(id, text)
+        save_time = (time.perf_counter() - start) / (count * saves)
+
+        with db.engine.read() as connection:
+            stored = connection.execute("SELECT sum(length(data)) FROM revisions;").fetchone()[0]
+            tables = dict(
+                connection.execute(
+                    """SELECT name, sum(pgsize) FROM dbstat
+                       WHERE name IN ('revisions', 'revisions_note') GROUP BY name;
+                       """
+                ).fetchall()
+            )
+
+        restore_times = []
+        for id in rng.sample(ids, min(len(ids), 20)):
+            for number in (1, saves // 2, saves):
+                start = time.perf_counter()
+                db.get_revision_text(id, number)
+                restore_times.append(time.perf_counter() - start)
+
+        db.close_conn()
+
+    return {
+        "revisions": count * saves,
+        "full copies, bytes": full_copies,
+        "full copies zlib, bytes": full_copies_zlib,
+        "revisions data, bytes": stored,
+        "revisions pages, bytes": sum(tables.values()),
+        "save, ms": save_time * 1000,
+        "restore median, ms": statistics.median(restore_times) * 1000,
+        "restore max, ms": max(restore_times) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--notes", type=int, default=100)
+    parser.add_argument("--saves", type=int, default=100)
+    args = parser.parse_args()
+
+    results = run(args.notes, args.saves)
+    for label, value in results.items():
+        print(f"{label:>28} {value:>14,.2f}" if isinstance(value, float) else f"{label:>28} {value:>14,}")
+
+    ratio = results["full copies, bytes"] / results["revisions pages, bytes"]
+    print(f"{'smaller than full copies':>28} {ratio:>13.1f}x")
+
+
+if __name__ == "__main__":
+    main()
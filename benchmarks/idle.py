@@ -0,0 +1,104 @@
+"""
+    Idle benchmark: renders and CPU time of the list and create screens
+    while nobody touches them.
+
+    Screens are redrawn only when something changes, so an idle screen
+    should not render at all. `--check` makes this a test: it exits with
+    status 1 if any screen rendered while idle.
+
+    Usage: python -m benchmarks.idle [--notes 10000] [--seconds 60] [--check] [--json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.generate import data_home_for
+
+# Seconds for a screen to settle after its first render, so background
+# work of startup (prefetching, indexing) isn't counted as idle time
+SETTLE_TIME = 1.0
+
+
+async def measure(screen, seconds, setup=None):
+    app = screen.application
+    renders = []
+    rendered = asyncio.Event()
+
+    def after_render(_):
+        renders.append(time.perf_counter())
+        rendered.set()
+
+    app.after_render += after_render
+    if setup:
+        setup()
+    task = asyncio.ensure_future(app.run_async())
+    await rendered.wait()
+    await asyncio.sleep(SETTLE_TIME)
+
+    count = len(renders)
+    cpu_started = time.process_time()
+    await asyncio.sleep(seconds)
+    cpu = time.process_time() - cpu_started
+    idle_renders = len(renders) - count
+
+    app.exit()
+    await task
+    return {"renders": idle_renders, "cpu, s": cpu}
+
+
+def run(count, seconds):
+    with tempfile.TemporaryDirectory() as root:
+        os.environ["XDG_DATA_HOME"] = data_home_for(root, count)
+
+        from prompt_toolkit.application import create_app_session
+        from prompt_toolkit.input import create_pipe_input
+        from prompt_toolkit.output import DummyOutput
+
+        results = {}
+        with create_pipe_input() as pipe_input:
+            with create_app_session(input=pipe_input, output=DummyOutput()):
+                import notty.screens.list as list_screen
+                import notty.screens.create as create_screen
+
+                def open_first_note():
+                    list_screen.update_text_window(0)
+                    list_screen.state.focused_window = list_screen.sidebar
+
+                screens = [("list", list_screen, open_first_note), ("create", create_screen, None)]
+                for name, screen, setup in screens:
+                    metrics = asyncio.run(measure(screen, seconds, setup))
+                    for metric, value in metrics.items():
+                        results[f"{name} {metric}"] = value
+                    screen.db.close_conn()
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--notes", type=int, default=10000)
+    parser.add_argument("--seconds", type=float, default=60)
+    parser.add_argument("--check", action="store_true", help="Fail if any screen rendered while idle")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    results = run(args.notes, args.seconds)
+    if args.json:
+        print(json.dumps(results))
+    else:
+        for screen in ("list", "create"):
+            print(
+                f"{screen:>8} {results[f'{screen} renders']:>6} renders "
+                f"{results[f'{screen} cpu, s'] * 1000:>10.1f}ms CPU in {args.seconds:g}s"
+            )
+
+    if args.check and any(results[f"{screen} renders"] for screen in ("list", "create")):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+    Listing benchmark: time to load note summaries for the list screen
+    and to render `notty list -n` in its output formats.
+
+    Usage: python -m benchmarks.listing [--notes 10000] [--repeat 5] [--json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.generate import data_home_for
+
+# `notty list -n` invocations whose whole output is rendered
+COMMANDS = [
+    ("list -n", ["list", "-n"]),
+    ("list -n json", ["list", "-n", "--format", "json"]),
+    ("list -n tsv", ["list", "-n", "--format", "tsv"]),
+]
+
+
+def median_time(repeat, function):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def all_pages(db):
+    """ Walks every page of summaries like the sidebar scrolled to the end """
+    page = db.get_page()
+    while page:
+        page = db.get_page(before=(page[-1].created_at, page[-1].id))
+
+
+def run(count, repeat):
+    with tempfile.TemporaryDirectory() as root:
+        os.environ["XDG_DATA_HOME"] = data_home_for(root, count)
+
+        from click.testing import CliRunner
+        from notty.app import cli
+        from notty.lib.db import Notes
+
+        db = Notes()
+        db.engine.search_index_built.wait()
+
+        results = {
+            "get_all, s": median_time(repeat, db.get_all),
+            "first page, s": median_time(repeat, db.get_page),
+            "all pages, s": median_time(repeat, lambda: all_pages(db)),
+            "previews, s": median_time(repeat, lambda: sum(1 for _ in db.iter_previews())),
+        }
+
+        runner = CliRunner()
+
+        def invoke(argv):
+            result = runner.invoke(cli, argv)
+            if result.exit_code:
+                raise RuntimeError(f"notty {' '.join(argv)} failed") from result.exception
+
+        for label, argv in COMMANDS:
+            results[f"{label}, s"] = median_time(repeat, lambda: invoke(argv))
+
+        db.close_conn()
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--notes", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    results = run(args.notes, args.repeat)
+    if args.json:
+        return print(json.dumps(results))
+
+    for label, seconds in results.items():
+        print(f"{label:>20} {seconds * 1000:>10.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
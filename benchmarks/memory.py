@@ -0,0 +1,103 @@
+"""
+    Memory benchmark: bytes taken per loaded note by `Note` / `NoteSummary`
+    records against the dicts which `Notes` used to return for every row.
+
+    Rows are fetched before allocations are traced, so titles, texts and
+    timestamps are shared and only the per-note containers are counted.
+    The full cost of `get_page(limit=-1)`, which loads the whole sidebar,
+    is shown for scale.
+
+    Usage: python -m benchmarks.memory [--notes 100000] [--json]
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import tracemalloc
+
+from benchmarks.generate import data_home_for
+
+
+def as_dict_summaries(rows):
+    return [
+        {"id": entry[0], "title": entry[1], "created_at": entry[2], "updated_at": entry[3]}
+        for entry in rows
+    ]
+
+
+def as_dict_notes(rows):
+    return [
+        {
+            "id": entry[0],
+            "title": entry[1],
+            "text": entry[2],
+            "created_at": entry[3],
+            "updated_at": entry[4],
+        }
+        for entry in rows
+    ]
+
+
+def traced_size(function, *args):
+    """ Returns bytes allocated by `function(*args)` and still held by its result """
+    tracemalloc.start()
+    result = function(*args)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def run(count):
+    with tempfile.TemporaryDirectory() as root:
+        os.environ["XDG_DATA_HOME"] = data_home_for(root, count)
+
+        from notty.lib.db import Notes
+        from notty.lib.Note import Note, NoteSummary
+
+        db = Notes()
+        db.engine.search_index_built.wait()
+        with db.engine.read() as connection:
+            summaries = connection.execute(
+                "SELECT id, title, created_at, updated_at FROM notes;"
+            ).fetchall()
+            notes = connection.execute(
+                "SELECT id, title, text, created_at, updated_at FROM notes;"
+            ).fetchall()
+
+        results = {
+            "summary dict, bytes": traced_size(as_dict_summaries, summaries) / count,
+            "summary record, bytes": traced_size(
+                lambda: [NoteSummary(*row) for row in summaries]
+            ) / count,
+            "note dict, bytes": traced_size(as_dict_notes, notes) / count,
+            "note record, bytes": traced_size(lambda: [Note(*row) for row in notes]) / count,
+        }
+        del summaries, notes
+
+        results["get_page all, bytes"] = traced_size(lambda: db.get_page(limit=-1)) / count
+        db.close_conn()
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--notes", type=int, default=100000)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    results = run(args.notes)
+    if args.json:
+        return print(json.dumps(results))
+
+    for label, value in results.items():
+        print(f"{label:>24} {value:>10.1f}")
+
+    for kind in ("summary", "note"):
+        saved = 1 - results[f"{kind} record, bytes"] / results[f"{kind} dict, bytes"]
+        print(f"{kind + ' records save':>24} {saved:>10.0%}")
+
+
+if __name__ == "__main__":
+    main()
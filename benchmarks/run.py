@@ -0,0 +1,162 @@
+"""
+    Benchmark suite runner: runs benchmarks on generated stores of every
+    given size and saves their results as JSON, or compares two such files.
+
+    Every benchmark runs in a fresh interpreter, so imports, caches and
+    the opened database of one run never leak into the next. Generated
+    stores are kept in `--cache` (or a temporary directory), so a store
+    of a million notes is generated only once.
+
+    Usage:
+        python -m benchmarks.run [--notes 1000 10000] [--suites crud listing] [--repeat 3] [-o results.json]
+        python -m benchmarks.run --compare base.json new.json [--threshold 0.1]
+
+    Metrics named with `/s` are throughputs, higher is better, all others
+    are times or sizes, lower is better. Compare exits with status 1
+    when a metric got worse by more than the threshold.
+"""
+
+from datetime import datetime
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.generate import CACHE_ENV
+
+# Benchmark modules and their arguments for a store of `count` notes
+SUITES = {
+    "startup": lambda count: ["--notes", str(count), "--repeat", "3"],
+    "crud": lambda count: ["--notes", str(count), "--ops", "500"],
+    "listing": lambda count: ["--notes", str(count), "--repeat", "3"],
+    "sidebar_keys": lambda count: ["--notes", str(count), "--presses", "1000"],
+    "autosave": lambda count: ["--notes", str(count), "--flushes", "20"],
+    "search": lambda count: ["--notes", str(count), "--repeat", "5"],
+    "fuzzy_filter": lambda count: ["--titles", str(count)],
+    "memory": lambda count: ["--notes", str(count)],
+    "idle": lambda count: ["--notes", str(count), "--seconds", "10"],
+}
+
+DEFAULT_NOTES = [1000, 10000]
+
+# Relative change of a metric which is reported as a regression
+DEFAULT_THRESHOLD = 0.1
+
+
+def run_suite(name, count, env):
+    """ Runs a benchmark module in a subprocess, returns its metrics """
+    argv = [sys.executable, "-m", f"benchmarks.{name}", "--json"] + SUITES[name](count)
+    output = subprocess.check_output(argv, env=env)
+    results = json.loads(output.decode("utf-8").strip().splitlines()[-1])
+
+    # Benchmarks which take several sizes report results by size
+    return results.get(str(count), results)
+
+
+def get_metadata(notes):
+    try:
+        commit = subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL
+        ).decode("utf-8").strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "notes": notes,
+    }
+
+
+def run(notes, suites, repeat=1, cache=None):
+    """ Runs every suite `repeat` times for every size, keeps medians of the metrics """
+    results = {}
+    with tempfile.TemporaryDirectory() as root:
+        env = dict(os.environ)
+        env[CACHE_ENV] = cache or os.path.join(root, "stores")
+
+        for name in suites:
+            results[name] = {}
+            for count in notes:
+                print(f"  {name} with {count} notes", file=sys.stderr, flush=True)
+                runs = [run_suite(name, count, env) for _ in range(repeat)]
+                results[name][str(count)] = {
+                    metric: statistics.median(run[metric] for run in runs) for metric in runs[0]
+                }
+
+    metadata = get_metadata(notes)
+    metadata["repeat"] = repeat
+    return {"metadata": metadata, "results": results}
+
+
+def is_throughput(metric):
+    return "/s" in metric
+
+
+def compare(base, new, threshold=DEFAULT_THRESHOLD):
+    """ Returns rows of `(suite, notes, metric, base, new, change, is_regression)` """
+    rows = []
+    for suite, sizes in new["results"].items():
+        for count, metrics in sizes.items():
+            base_metrics = base["results"].get(suite, {}).get(count, {})
+            for metric, value in metrics.items():
+                old = base_metrics.get(metric)
+                if not old:
+                    continue
+
+                change = (value - old) / old
+                worse = -change if is_throughput(metric) else change
+                rows.append((suite, count, metric, old, value, change, worse > threshold))
+    return rows
+
+
+def format_value(metric, value):
+    if metric.endswith(", s"):
+        return f"{value * 1e6:.1f}µs" if value < 0.001 else f"{value * 1000:.2f}ms"
+    return f"{value:,.0f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--notes", type=int, nargs="+", default=DEFAULT_NOTES)
+    parser.add_argument("--suites", nargs="+", choices=SUITES, default=list(SUITES))
+    parser.add_argument("--repeat", type=int, default=1, help="Runs of every suite, medians are kept")
+    parser.add_argument("--cache", help="Directory to keep generated stores in between runs")
+    parser.add_argument("--output", "-o", help="File to save results to, printed if not given")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"))
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+
+    if not args.compare:
+        results = run(args.notes, args.suites, args.repeat, args.cache)
+        if not args.output:
+            return print(json.dumps(results, indent=2))
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+        return
+
+    with open(args.compare[0]) as base_file, open(args.compare[1]) as new_file:
+        rows = compare(json.load(base_file), json.load(new_file), args.threshold)
+
+    for suite, count, metric, old, value, change, is_regression in rows:
+        mark = "REGRESSION" if is_regression else ""
+        print(
+            f"{suite:>13} {count:>8} {metric:<32.32} {format_value(metric, old):>12} "
+            f"{format_value(metric, value):>12} {change:>+8.1%}  {mark}"
+        )
+
+    regressions = sum(row[-1] for row in rows)
+    print(f"\n{regressions} of {len(rows)} metrics regressed by more than {args.threshold:.0%}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
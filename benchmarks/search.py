@@ -0,0 +1,67 @@
+"""
+    Full-text search benchmark: index build time on an existing store
+    and query latency for words of different frequencies.
+
+    Usage: python -m benchmarks.search [--notes 100000] [--repeat 20] [--json]
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from benchmarks.generate import data_home_for, make_vocabulary
+
+
+def queries(seed=0):
+    """ Yields `(label, query)` pairs, from rare words to very common ones """
+    words = make_vocabulary(random.Random(seed))[0]
+    for rank in (10000, 1000, 100, 10):
+        yield f"word #{rank}", words[rank]
+    yield "prefix", words[1000][:3]
+    yield "two words", f"{words[50]} {words[500]}"
+
+
+def run(count, repeat):
+    with tempfile.TemporaryDirectory() as root:
+        os.environ["XDG_DATA_HOME"] = data_home_for(root, count)
+
+        from notty.lib.db import Notes
+
+        db = Notes()
+        start = time.perf_counter()
+        db.engine.search_index_built.wait()
+        results = {"build index": time.perf_counter() - start}
+
+        for label, query in queries():
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                db.search(query)
+                timings.append(time.perf_counter() - start)
+            results[f"{label} ({query})"] = statistics.median(timings)
+
+        db.close_conn()
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--notes", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    results = run(args.notes, args.repeat)
+    if args.json:
+        return print(json.dumps({f"{label}, s": seconds for label, seconds in results.items()}))
+
+    for label, seconds in results.items():
+        print(f"{label:>32} {seconds * 1000:>10.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
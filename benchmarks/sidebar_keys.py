@@ -0,0 +1,112 @@
+"""
+    Sidebar benchmark: key-press-to-redraw latency and memory of the list
+    screen over a long run of <up>/<down> presses.
+
+    Usage: python -m benchmarks.sidebar_keys [--notes 5000] [--presses 10000] [--memory] [--json]
+
+    `--memory` traces allocations with `tracemalloc`, which slows down
+    every key press, so latencies of such runs are not comparable.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.generate import data_home_for
+
+UP, DOWN = "\x1b[A", "\x1b[B"
+
+# Presses between two memory samples
+SAMPLE_EVERY = 1000
+
+
+async def drive(screen, pipe_input, presses, memory):
+    app = screen.application
+    rendered = asyncio.Event()
+    app.after_render += lambda _: rendered.set()
+
+    screen.update_text_window(0)
+    screen.state.focused_window = screen.sidebar
+    task = asyncio.ensure_future(app.run_async())
+    await rendered.wait()
+
+    latencies, samples = [], []
+    if memory:
+        tracemalloc.start()
+
+    for i in range(presses):
+        # Walk down through the notes for the first half, then back up
+        key = DOWN if i < presses // 2 else UP
+        rendered.clear()
+        start = time.perf_counter()
+        pipe_input.send_text(key)
+        await rendered.wait()
+        latencies.append(time.perf_counter() - start)
+
+        if i % SAMPLE_EVERY == 0 or i == presses - 1:
+            current, _ = tracemalloc.get_traced_memory() if memory else (0, 0)
+            samples.append((i, current, len(screen.sidebar_bindings.bindings)))
+
+    if memory:
+        tracemalloc.stop()
+    app.exit()
+    await task
+    return latencies, samples
+
+
+def run(count, presses, memory=False):
+    with tempfile.TemporaryDirectory() as root:
+        os.environ["XDG_DATA_HOME"] = data_home_for(root, count)
+
+        from prompt_toolkit.application import create_app_session
+        from prompt_toolkit.input import create_pipe_input
+        from prompt_toolkit.output import DummyOutput
+
+        with create_pipe_input() as pipe_input:
+            with create_app_session(input=pipe_input, output=DummyOutput()):
+                import notty.screens.list as screen
+
+                result = asyncio.run(drive(screen, pipe_input, presses, memory))
+                screen.db.close_conn()
+                return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--notes", type=int, default=5000)
+    parser.add_argument("--presses", type=int, default=10000)
+    parser.add_argument("--memory", action="store_true")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    latencies, samples = run(args.notes, args.presses, args.memory)
+    latencies = sorted(latencies)
+
+    if args.json:
+        results = {
+            "latency median, s": statistics.median(latencies),
+            "latency p99, s": latencies[int(len(latencies) * 0.99)],
+            "latency max, s": latencies[-1],
+        }
+        if args.memory:
+            results["memory growth, bytes"] = samples[-1][1] - samples[0][1]
+        return print(json.dumps(results))
+
+    print(f"{'presses':>8}{'memory':>12}{'bindings':>10}")
+    for i, memory, bindings in samples:
+        memory = f"{memory / 1024:.0f}KB" if args.memory else "-"
+        print(f"{i:>8}{memory:>12}{bindings:>10}")
+
+    print()
+    print(f"latency  median {statistics.median(latencies) * 1000:.2f}ms", end="  ")
+    print(f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.2f}ms", end="  ")
+    print(f"max {latencies[-1] * 1000:.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+    Startup benchmark: import time and time to first output of every command.
+
+    Usage: python -m benchmarks.startup [--notes 10000 100000] [--repeat 5] [--json]
+"""
+
+import argparse
+import json
+import os
+import select
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.generate import data_home_for
+
+# (name, argv, needs a terminal)
+COMMANDS = [
+    ("help", ["--help"], False),
+    ("edit", ["edit", "1", "--editor", "true"], False),
+    ("list -n", ["list", "-n"], False),
+    ("list -n json", ["list", "-n", "--format", "json"], False),
+    ("list -n grep", ["list", "-n", "--grep", "meeting"], False),
+    ("list", ["list"], True),
+    ("create", ["create"], True),
+]
+
+
+def environ(data_home):
+    env = dict(os.environ)
+    env.update(XDG_DATA_HOME=data_home, TERM="xterm", PAGER="cat")
+    return env
+
+
+def time_to_first_output(argv, env, tty, timeout=30):
+    """ Runs `notty <argv>` and returns seconds until its first output byte """
+    if tty:
+        master, slave = os.openpty()
+        stdin = stdout = slave
+    else:
+        master, slave = os.pipe()
+        stdin, stdout = subprocess.DEVNULL, slave
+
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "notty"] + argv,
+        stdin=stdin,
+        stdout=stdout,
+        stderr=subprocess.STDOUT,
+        env=env,
+    )
+    os.close(slave)
+
+    try:
+        ready, _, _ = select.select([master], [], [], timeout)
+        elapsed = time.perf_counter() - start if ready else float("nan")
+    finally:
+        process.kill()
+        process.wait()
+        os.close(master)
+
+    return elapsed
+
+
+def import_time(env):
+    """ Seconds spent by a fresh interpreter importing `notty.app` """
+    code = "import time; s = time.perf_counter(); import notty.app; print(time.perf_counter() - s)"
+    output = subprocess.check_output([sys.executable, "-c", code], env=env)
+    return float(output)
+
+
+def run(counts, repeat):
+    results = {}
+
+    with tempfile.TemporaryDirectory() as root:
+        for count in counts:
+            env = environ(data_home_for(root, count))
+            # Warm-up run: fills the OS cache
+            time_to_first_output(["list", "-n"], env, False)
+
+            timings = {"import": [import_time(env) for _ in range(repeat)]}
+            for name, argv, tty in COMMANDS:
+                timings[name] = [
+                    time_to_first_output(argv, env, tty) for _ in range(repeat)
+                ]
+            results[count] = {f"{k}, s": statistics.median(v) for k, v in timings.items()}
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--notes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    results = run(args.notes, args.repeat)
+    if args.json:
+        return print(json.dumps(results))
+
+    names = ["import"] + [name for name, _, _ in COMMANDS]
+    print(f"{'notes':>8}" + "".join(f"{name:>12}" for name in names))
+    for count, timings in results.items():
+        print(f"{count:>8}" + "".join(f"{timings[f'{n}, s'] * 1000:>10.1f}ms" for n in names))
+
+
+if __name__ == "__main__":
+    main()
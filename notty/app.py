@@ -3,8 +3,15 @@ import colorama
 import notty.screens as screens
 from notty.lib.CommandAliases import ClickAliasedGroup
 from notty.lib.db import Notes
+from notty.utils import compression, tracing
 from notty.utils.date_now import date_now
+from notty.utils.format_size import format_size
+from notty.utils.timestamps import format_epoch, parse_date
+import itertools
+import json
 import os
+import sys
+import time
 from colorama import Fore, Back, Style
 
 
@@ -12,15 +19,66 @@ NOW = date_now()
 RS = Style.RESET_ALL
 db = Notes()
 
+# Fields of notes printed by `list -n --format tsv`
+TSV_FIELDS = ("id", "created_at", "updated_at", "title", "preview")
+
+
+class DateParamType(click.ParamType):
+    """ `YYYY-MM-DD[ HH:MM[:SS]]` in local time, converted to seconds since the epoch """
+
+    name = "date"
+
+    def convert(self, value, param, ctx):
+        try:
+            return parse_date(value)
+        except ValueError:
+            self.fail(f"{value!r} is not a date like 2020-12-31 or 2020-12-31 23:59", param, ctx)
+
+
+def parse_ids(ctx, param, value):
+    """ Parses comma separated IDs """
+    if value is None:
+        return None
+    try:
+        return [int(id) for id in value.split(",") if id.strip()]
+    except ValueError:
+        raise click.BadParameter(f"{value!r} is not a list of IDs like 1,2,3")
+
 
 @click.group(cls=ClickAliasedGroup)
-def cli():
+@click.option(
+    "--profile",
+    type=click.Path(dir_okay=False, writable=True),
+    envvar=tracing.TRACE_ENV,
+    help=f"Saves a trace of queries, renders and key presses to a file (or set {tracing.TRACE_ENV})",
+)
+@click.pass_context
+def cli(ctx, profile):
     """
     Fast terminal-based notes application
 
     Storage is located in the system's default app_dir. SQLite3 is used to store and process your notes.
     """
-    pass
+    # Settings are checked before a command opens the database, which reads them
+    try:
+        compression.get_settings()
+    except ValueError as e:
+        raise click.UsageError(str(e))
+
+    # Writes metrics of slow queries, if the command opened the database
+    ctx.call_on_close(db.close_conn)
+
+    if not profile:
+        return
+
+    tracing.enable(profile)
+    started = time.perf_counter()
+
+    def finish():
+        tracing.add(ctx.invoked_subcommand or "notty", "command", started)
+        click.echo(f"\n{tracing.finish()}\n", err=True)
+
+    ctx.call_on_close(finish)
 
 
 @cli.command(aliases=["edit", "e"], help="Edits a note in your default editor")
@@ -35,17 +93,251 @@ def edit(id, editor):
         )
 
     try:
-        new_text = click.edit(text=note.get("text"), editor=editor)
+        new_text = click.edit(text=note.text, editor=editor)
     except Exception as e:
         print(f"On trying to edit: {e}")
         return
+
+    # Editor returns None if the text was not changed
+    if new_text is None:
+        return click.echo(f"\n  Note with ID {Fore.YELLOW}{id}{RS} was not changed\n")
+
     db.update_text(id, new_text)
     click.echo(f"\n\n  Note with ID {Fore.YELLOW}{id}{RS} was successfully saved!\n")
 
 
+@cli.command(aliases=["history", "h"], help="Shows earlier versions of a note")
+@click.argument("id", type=click.INT)
+@click.option("--show", "-s", type=click.INT, help="Print the text of a revision")
+@click.option("--restore", "-r", type=click.INT, help="Bring the text of a revision back")
+def history(id, show, restore):
+    note = db.get(id)
+
+    if not note:
+        return click.echo(
+            f"\n  Note with ID {Fore.YELLOW}{id}{RS} was not found\n  Try searching in {Fore.CYAN}notty list{RS}\n"
+        )
+
+    if show is not None or restore is not None:
+        number = show if show is not None else restore
+        text = db.get_revision_text(id, number)
+        if text is None:
+            return click.echo(f"\n  Note {Fore.YELLOW}{id}{RS} has no revision {number}\n")
+
+        if show is not None:
+            return click.echo_via_pager(text)
+
+        db.restore_revision(id, number)
+        return click.echo(
+            f"\n  Revision {number} of note {Fore.YELLOW}{id}{RS} was restored,"
+            f" the replaced text was kept as a revision\n"
+        )
+
+    revisions = db.get_revisions(id)
+    if not revisions:
+        return click.echo(f"\n  Note {Fore.YELLOW}{id}{RS} was never changed\n")
+
+    click.echo(f"\n  {Style.BRIGHT}{Fore.CYAN}{note.title}{RS}\n")
+    for revision in revisions:
+        click.echo(
+            f"  {Fore.YELLOW}{revision['number']:>5}{RS}  {format_epoch(revision['created_at'])}"
+            f"  {Style.DIM}{revision['size']} characters{RS}"
+        )
+    click.echo(f"\n  Run {Fore.CYAN}notty history {id} --show <number>{RS} to see one\n")
+
+
+@cli.command(aliases=["search", "s"], help="Searches your notes by their titles and texts")
+@click.argument("query", nargs=-1, required=True)
+@click.option("--limit", "-l", default=20, show_default=True, help="Maximum count of notes to show")
+def search(query, limit):
+    query = " ".join(query)
+    notes = db.search(query, limit=limit, highlight=(Style.BRIGHT + Fore.YELLOW, RS))
+
+    if not notes:
+        return click.echo(f"\n  Nothing was found for {Fore.YELLOW}{query}{RS}\n")
+
+    def format_note(note):
+        id, title, snippet = note.id, note.title, note.snippet
+        ts = format_epoch(note.created_at)
+        formatted_snippet = "\n    ".join(snippet.strip().split("\n"))
+        return "\n".join(
+            [
+                f"{Fore.YELLOW}[{id}]{RS} {Style.BRIGHT}{Fore.CYAN}{title}{RS}",
+                f"{Style.DIM}Date: {ts}{RS}",
+                f"\n    {formatted_snippet}\n\n",
+            ]
+        )
+
+    click.echo_via_pager(map(format_note, notes))
+
+
+@cli.command(
+    "import",
+    aliases=["import", "i"],
+    help="Imports notes from directories and tarballs of Markdown/text files or from JSONL files",
+)
+@click.argument("paths", nargs=-1, required=True, type=click.Path(exists=True))
+@click.option(
+    "--jobs", "-j", type=click.INT, default=None, help="Processes parsing files  [default: CPU count]"
+)
+def import_(paths, jobs):
+    # Imported lazily, as it is needed by this command only
+    from notty.lib.Importer import Importer
+
+    def show_progress(importer):
+        click.echo(
+            f"\r  Imported {importer.imported}, skipped {importer.skipped} duplicates"
+            f" ({importer.rate:.0f} notes/s)",
+            nl=False,
+            err=True,
+        )
+
+    try:
+        importer = Importer(db, jobs=jobs, on_progress=show_progress).run(paths)
+    except KeyboardInterrupt:
+        return click.echo("\n\n  Interrupted, run the command again to resume\n", err=True)
+
+    click.echo(
+        f"\n\n  {Fore.GREEN}Imported {importer.imported} notes{RS},"
+        f" skipped {importer.skipped} which were imported already\n"
+    )
+    for key, error in importer.failed:
+        click.echo(f"  {Fore.YELLOW}Could not import{RS} {key}: {error}", err=True)
+
+
+@cli.command(
+    aliases=["export", "x"],
+    help="Exports notes to JSONL, a directory of Markdown files or a tar stream",
+)
+@click.option(
+    "--format",
+    "-f",
+    "format_",
+    type=click.Choice(["jsonl", "md", "tar"]),
+    default="jsonl",
+    show_default=True,
+)
+@click.option(
+    "--output",
+    "-o",
+    default="-",
+    show_default=True,
+    help="File to write, or a directory for md. '-' writes to stdout",
+)
+@click.option("--since", type=DateParamType(), help="Only notes edited since a date")
+@click.option("--ids", callback=parse_ids, help="Only notes with given comma separated IDs")
+@click.option("--gzip", "-z", is_flag=True, help="Compress the tar stream")
+def export(format_, output, since, ids, gzip):
+    # Imported lazily, as it is needed by this command only
+    from notty.lib.Exporter import export_jsonl, export_markdown, export_tar
+
+    notes = db.iter_notes(since=since, ids=ids)
+    to_stdout = output == "-"
+
+    if format_ == "md":
+        if to_stdout:
+            raise click.UsageError("Markdown notes are exported into a directory, pass it as --output")
+        count = export_markdown(notes, output)
+    elif format_ == "tar":
+        stream = click.get_binary_stream("stdout") if to_stdout else open(output, "wb")
+        with stream:
+            count = export_tar(notes, stream, compression="gz" if gzip else "")
+    else:
+        stream = click.get_text_stream("stdout") if to_stdout else open(output, "w", encoding="utf-8")
+        with stream:
+            count = export_jsonl(notes, stream)
+
+    click.echo(f"  {Fore.GREEN}Exported {count} notes{RS}", err=True)
+
+
+@cli.command(help="Compacts the database file")
+@click.option(
+    "--recompress",
+    is_flag=True,
+    help="Store texts with the current NOTTY_COMPRESSION settings first",
+)
+def vacuum(recompress):
+    def get_size():
+        return sum(
+            os.path.getsize(path)
+            for path in (db.path, db.path + "-wal")
+            if os.path.exists(path)
+        )
+
+    size = get_size()
+    if recompress:
+        rewritten = db.recompress(
+            on_progress=lambda checked: click.echo(f"\r  Checked {checked} notes", nl=False, err=True)
+        )
+        click.echo(f"\n  Rewrote {rewritten} notes", err=True)
+
+    db.vacuum()
+    click.echo(
+        f"\n  {Fore.GREEN}Database was compacted{RS}: {size / 2 ** 20:.1f} MiB -> {get_size() / 2 ** 20:.1f} MiB\n"
+    )
+
+
+@cli.command(help="Shows sizes of notes and of the database, and slow queries")
+@click.option("--format", "format_", type=click.Choice(["text", "json"]), default="text")
+def stats(format_):
+    data = db.get_stats()
+    data["slow_queries"] = db.get_slow_queries()
+
+    if format_ == "json":
+        return click.echo(json.dumps(data, indent=2))
+
+    def row(label, value):
+        return f"  {Style.BRIGHT}{label:<16}{RS}{value}"
+
+    lines = [
+        "",
+        row("Notes", f"{data['notes']} ({data['compressed']} compressed), {data['revisions']} revisions"),
+        row(
+            "Texts",
+            f"{format_size(data['total_size'])} total ({format_size(data['stored_size'])} stored), "
+            f"{format_size(data['average_size'])} average, "
+            f"{format_size(data['p99_size'])} p99, {format_size(data['max_size'])} max",
+        ),
+        row(
+            "Database file",
+            f"{format_size(data['file_size'])}, {format_size(data['free_size'])} free, "
+            f"WAL {format_size(data['wal_size'])}",
+        ),
+    ]
+
+    if data["tables"] is not None:
+        lines.append("")
+        lines.append(f"  {Style.DIM}{'Table':<16}{'Data':>12}{'Indexes':>12}{RS}")
+        for table, sizes in sorted(data["tables"].items(), key=lambda item: -sum(item[1].values())):
+            lines.append(
+                f"  {table:<16}{format_size(sizes['data']):>12}{format_size(sizes['indexes']):>12}"
+            )
+
+    lines.append("")
+    if data["slow_queries"]:
+        lines.append(f"  {Style.DIM}Slowest recent queries{RS}")
+        for query in data["slow_queries"]:
+            lines.append(
+                f"  {query['duration']:>9.1f} ms  {query['name']:<18} {query['rows']:>7} rows  "
+                f"{Style.DIM}{format_epoch(query['created_at'])}{RS}"
+            )
+    else:
+        lines.append(f"  {Style.DIM}No slow queries were recorded{RS}")
+
+    # Hints for stores which would get smaller or faster
+    if data["file_size"] and data["free_size"] > data["file_size"] * 0.2:
+        lines.append(f"\n  {Fore.YELLOW}A lot of the file is free pages, run notty vacuum{RS}")
+    if db.engine.compression[0] == "none" and data["p99_size"] >= compression.DEFAULT_THRESHOLD:
+        lines.append(
+            f"\n  {Fore.YELLOW}Notes are large, set NOTTY_COMPRESSION=zlib and run notty vacuum --recompress{RS}"
+        )
+
+    click.echo("\n".join(lines) + "\n")
+
+
 @cli.command(aliases=["create", "c"], help="Creates a new note")
 def create():
-    return screens.create.execute()
+    return screens.execute("create")
 
 
 @cli.command(aliases=["list", "l"], help="Lists your notes in a cool fancy window")
@@ -57,27 +349,78 @@ def create():
     is_flag=True,
     help="Print your notes as a list without showing a fancy window",
 )
-def list(no_window, id):
+@click.option(
+    "--debounce",
+    type=click.FLOAT,
+    default=1,
+    show_default=True,
+    help="Seconds after you stop typing before the note is saved",
+)
+@click.option(
+    "--sort",
+    type=click.Choice(["created", "edited"]),
+    default="created",
+    show_default=True,
+    help="Show newest or recently edited notes first",
+)
+@click.option("--since", type=DateParamType(), help="Only notes created (or edited) since a date")
+@click.option("--until", type=DateParamType(), help="Only notes created (or edited) before a date")
+@click.option("--grep", "-g", help="Only notes whose title or text contain a string")
+@click.option("--limit", type=click.INT, default=-1, help="Maximum count of notes to print")
+@click.option("--offset", type=click.INT, default=0, help="Count of notes to skip")
+@click.option(
+    "--format",
+    "format_",
+    type=click.Choice(["text", "json", "tsv"]),
+    default="text",
+    show_default=True,
+    help="json prints a JSON object per line, tsv prints tab separated fields",
+)
+def list(no_window, id, debounce, sort, since, until, grep, limit, offset, format_):
     if no_window or id:
+        order = "updated" if sort == "edited" else "created"
+        notes = db.iter_previews(
+            order=order,
+            since=since,
+            until=until,
+            grep=grep,
+            limit=limit,
+            offset=offset,
+        )
 
-        def format_note(note):
-            id, title, text, ts = note["id"], note["title"], note["text"], note["ts"]
-            formatted_text = "\n    ".join(text.strip().split("\n"))[:96] + (
-                "..." if len(text) > 96 else ""
-            )
-            return "\n".join(
-                [
-                    f"{Fore.YELLOW}[{id}]{RS} {Style.BRIGHT}{Fore.CYAN}{title}{RS}",
-                    f"{Style.DIM}Date: {ts}{RS}",
-                    f"\n    {formatted_text}\n\n",
-                ]
-            )
+        if format_ == "text":
+
+            def format_note(note):
+                id, title, preview = note["id"], note["title"], note["preview"]
+                ts = format_epoch(note[f"{order}_at"])
+                formatted_text = "\n    ".join(preview.strip().split("\n")) + (
+                    "..." if note["is_cut"] else ""
+                )
+                return "\n".join(
+                    [
+                        f"{Fore.YELLOW}[{id}]{RS} {Style.BRIGHT}{Fore.CYAN}{title}{RS}",
+                        f"{Style.DIM}Date: {ts}{RS}",
+                        f"\n    {formatted_text}\n\n",
+                    ]
+                )
+
+            return click.echo_via_pager(map(format_note, notes))
+
+        if format_ == "json":
+            lines = (json.dumps(note, ensure_ascii=False) for note in notes)
+        else:
+            escape = str.maketrans({"\t": "\\t", "\n": "\\n", "\r": "\\r", "\\": "\\\\"})
+            rows = ([str(note[field]).translate(escape) for field in TSV_FIELDS] for note in notes)
+            lines = map("\t".join, itertools.chain([TSV_FIELDS], rows))
 
-        notes = reversed(db.get_all())
-        notes = map(format_note, notes)
-        click.echo_via_pager(notes)
+        try:
+            for line in lines:
+                click.echo(line)
+        except BrokenPipeError:
+            # Output was cut short, e.g. by `head`, silence the error on exit too
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
     else:
-        return screens.list.execute()
+        return screens.execute("list", debounce=debounce)
 
 
 # Initialize color support
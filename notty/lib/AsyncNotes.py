@@ -0,0 +1,101 @@
+"""
+    Asynchronous facade of the storage layer for the screens.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import asyncio
+
+# Methods of `Notes` which write to the database
+WRITE_METHODS = {
+    "insert",
+    "insert_many",
+    "update_many",
+    "update_text",
+    "update_texts",
+    "update_title",
+    "delete",
+    "delete_many",
+    "restore_revision",
+    "log_imports",
+    "recompress",
+    "vacuum",
+}
+
+# Seconds a call may take before it is shown as being in progress,
+# so quick calls don't make the screen flicker
+BUSY_DELAY = 0.2
+
+
+class AsyncNotes:
+    """
+    Runs methods of `Notes` off the event loop and returns awaitables:
+
+        text = await async_db.get_text(id)
+
+    Writes run one after another on a writer thread, reads run on a reader
+    thread through the engine's pool of read connections, so a read is
+    never queued behind a slow write. While a call takes longer than
+    `busy_delay`, `busy` tells what is going on ("saving" or "loading")
+    and `on_busy_change` is called, so screens can show it.
+    """
+
+    def __init__(self, db, busy_delay=BUSY_DELAY, on_busy_change=None):
+        self.db = db
+        self.busy_delay = busy_delay
+        self.on_busy_change = on_busy_change
+
+        self._writer = ThreadPoolExecutor(max_workers=1)
+        self._reader = ThreadPoolExecutor(max_workers=1)
+
+        # Kinds of calls which are running longer than `busy_delay`
+        self._slow = []
+
+    def __getattr__(self, name):
+        method = getattr(self.db, name)
+        kind = "saving" if name in WRITE_METHODS else "loading"
+
+        async def call(*args, **kwargs):
+            return await self.run(kind, method, *args, **kwargs)
+
+        call.__name__ = name
+        return call
+
+    async def run(self, kind, function, *args, **kwargs):
+        """ Runs `function` on the writer thread if `kind` is "saving", on the reader otherwise """
+        loop = asyncio.get_event_loop()
+        executor = self._writer if kind == "saving" else self._reader
+        future = loop.run_in_executor(executor, partial(function, *args, **kwargs))
+
+        is_slow = False
+
+        def on_slow():
+            nonlocal is_slow
+            is_slow = True
+            self._slow.append(kind)
+            self._notify()
+
+        timer = loop.call_later(self.busy_delay, on_slow)
+        try:
+            return await future
+        finally:
+            timer.cancel()
+            if is_slow:
+                self._slow.remove(kind)
+                self._notify()
+
+    @property
+    def busy(self):
+        """ "saving" or "loading" while a slow call is running, otherwise None """
+        if "saving" in self._slow:
+            return "saving"
+        return "loading" if self._slow else None
+
+    def close(self):
+        """ Waits for running calls and stops the worker threads """
+        self._writer.shutdown()
+        self._reader.shutdown()
+
+    def _notify(self):
+        if self.on_busy_change:
+            self.on_busy_change()
@@ -0,0 +1,37 @@
+from asyncio import Future
+
+from prompt_toolkit.layout.dimension import D
+from prompt_toolkit.widgets import (
+    Button,
+    Dialog,
+    Label,
+    RadioList,
+)
+from prompt_toolkit.layout.containers import HSplit
+
+
+class ChoiceDialog:
+    def __init__(self, title="", label_text="", values=(), ok_text="OK"):
+        self.future = Future()
+
+        def accept():
+            self.future.set_result(self.radio_list.current_value)
+
+        def cancel():
+            self.future.set_result(None)
+
+        self.radio_list = RadioList(values=list(values))
+
+        ok_button = Button(text=ok_text, handler=accept)
+        cancel_button = Button(text="Cancel", handler=cancel)
+
+        self.dialog = Dialog(
+            title=title,
+            body=HSplit([Label(text=label_text), self.radio_list]),
+            buttons=[ok_button, cancel_button],
+            width=D(preferred=60),
+            modal=True,
+        )
+
+    def __pt_container__(self):
+        return self.dialog
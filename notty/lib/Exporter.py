@@ -0,0 +1,76 @@
+"""
+    Streaming export of notes.
+
+    Every format writes notes one by one as they are read from the DB,
+    so exporting takes the same memory whatever the count of notes.
+    Markdown files are written as `# Title` followed by the text, which
+    is what `notty import` reads back.
+"""
+
+import io
+import json
+import os
+import re
+import tarfile
+
+FORMATS = ("jsonl", "md", "tar")
+
+# Characters which are kept in file names, others become dashes
+UNSAFE_FILENAME_CHARS = re.compile(r"[^\w\-]+")
+
+MAX_FILENAME_TITLE = 48
+
+
+def to_markdown(note):
+    return f"# {note['title']}\n\n{note['text']}"
+
+
+def note_filename(note):
+    """ `<id>-<title>.md`, IDs keep names unique and sorted like notes """
+    slug = UNSAFE_FILENAME_CHARS.sub("-", note["title"]).strip("-")[:MAX_FILENAME_TITLE]
+    return f"{note['id']}-{slug}.md" if slug else f"{note['id']}.md"
+
+
+def export_jsonl(notes, file):
+    """ Writes notes as JSON Lines into a text file, returns their count """
+    count = 0
+    for note in notes:
+        file.write(json.dumps(note, ensure_ascii=False))
+        file.write("\n")
+        count += 1
+    return count
+
+
+def export_markdown(notes, directory):
+    """ Writes every note into a Markdown file of a directory, returns their count """
+    os.makedirs(directory, exist_ok=True)
+
+    count = 0
+    for note in notes:
+        path = os.path.join(directory, note_filename(note))
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(to_markdown(note))
+
+        # Keeps the time of the last edit on the file
+        if note["updated_at"]:
+            os.utime(path, (note["updated_at"], note["updated_at"]))
+        count += 1
+    return count
+
+
+def export_tar(notes, fileobj, compression=""):
+    """
+    Writes notes as Markdown files into a tar stream, returns their count.
+
+    The stream is written sequentially, so `fileobj` can be a pipe.
+    """
+    count = 0
+    with tarfile.open(fileobj=fileobj, mode=f"w|{compression}") as tar:
+        for note in notes:
+            data = to_markdown(note).encode("utf-8")
+            info = tarfile.TarInfo(f"notes/{note_filename(note)}")
+            info.size = len(data)
+            info.mtime = note["updated_at"] or 0
+            tar.addfile(info, io.BytesIO(data))
+            count += 1
+    return count
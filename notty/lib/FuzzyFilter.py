@@ -0,0 +1,163 @@
+"""
+    Incremental fuzzy filter, similar to fzf.
+
+    A query matches a title if all its characters appear in the title
+    in the same order. Matches are ranked by how tight and how early they
+    are, with bonuses for matches at the start of a word.
+"""
+
+from itertools import chain, islice
+import re
+import time
+
+# Seconds of matching done by one `step()`, leaves the rest of a frame for rendering
+STEP_BUDGET = 0.005
+
+# Candidates matched between two checks of the time budget
+CHUNK_SIZE = 256
+
+WORD_SEPARATORS = " -_./\\"
+
+
+def compile_query(query):
+    """ Compiles a query into a regex matching its characters in order """
+    return re.compile(".*?".join(re.escape(char) for char in query))
+
+
+def match_cost(key, query, match):
+    """ Cost of a match, the lower the better """
+    start, end = match.span()
+
+    # Prefer a contiguous occurrence if there is one
+    position = key.find(query)
+    if position != -1:
+        start, end = position, position + len(query)
+
+    cost = (end - start - len(query)) * 2 + start // 4
+    if start == 0:
+        cost -= 8
+    elif key[start - 1] in WORD_SEPARATORS:
+        cost -= 6
+    return cost
+
+
+class FuzzyFilter:
+    """
+    Filters `items` by their titles as the query is typed.
+
+    Matching is incremental: when the query grows, only the matches of
+    the previous query are scanned again, and results of the query's
+    prefixes are kept for when characters are erased. Work is split into
+    `step()` calls, each bounded by a time budget, so a keystroke never
+    blocks for longer than a frame.
+
+    Costs are small integers, so matches are kept in a bucket per cost
+    instead of being sorted again after every step.
+    """
+
+    def __init__(self, items, key=lambda item: item.title):
+        self.items = items
+        self._keys = [key(item).lower() for item in items]
+
+        self.query = ""
+        self.matches = list(range(len(items)))
+        self.done = True
+
+        self._cache = {"": self.matches}
+
+        # Indexes of matched items by their cost, in the order they were matched
+        self._buckets = {}
+        self._pending = iter(())
+        self._pattern = None
+
+    def set_query(self, query):
+        """ Starts matching a new query, call `step()` to make progress """
+        query = "".join(query.lower().split())
+        if query == self.query:
+            return
+
+        # Keep the results of the new query's prefixes only
+        self._cache = {q: m for q, m in self._cache.items() if query.startswith(q)}
+
+        if query in self._cache:
+            candidates = None
+        elif self.query and query.startswith(self.query):
+            # Matches of a grown query are among the matches of the previous one
+            candidates = list(self.matches)
+            candidates.extend(self._pending)
+        else:
+            longest = max((q for q in self._cache if query.startswith(q)), key=len)
+            candidates = self._cache[longest]
+
+        self.query = query
+        if candidates is None:
+            self.matches = self._cache[query]
+            self.done = True
+            self._buckets = {0: list(self.matches)}
+            self._pending = iter(())
+            return
+
+        self.done = False
+        self.matches = []
+        self._buckets = {}
+        self._pending = iter(candidates)
+        self._pattern = compile_query(query)
+
+    def remove(self, items):
+        """ Drops given items, e.g. deleted notes, from the items and every kept result """
+        removed = {id(item) for item in items}
+        new_indexes = {}
+        for index, item in enumerate(self.items):
+            if id(item) not in removed:
+                new_indexes[index] = len(new_indexes)
+        if len(new_indexes) == len(self.items):
+            return
+
+        def remap(indexes):
+            return [new_indexes[index] for index in indexes if index in new_indexes]
+
+        self.items = [self.items[index] for index in new_indexes]
+        self._keys = [self._keys[index] for index in new_indexes]
+        self.matches = remap(self.matches)
+        self._cache = {query: remap(matches) for query, matches in self._cache.items()}
+        self._buckets = {cost: remap(indexes) for cost, indexes in self._buckets.items()}
+        self._pending = iter(remap(self._pending))
+
+    def step(self, budget=STEP_BUDGET):
+        """ Matches candidates for up to `budget` seconds, returns True when done """
+        if self.done:
+            return True
+
+        deadline = time.perf_counter() + budget
+        search = self._pattern.search
+        keys = self._keys
+        query = self.query
+        buckets = self._buckets
+
+        while True:
+            chunk = list(islice(self._pending, CHUNK_SIZE))
+            for index in chunk:
+                key = keys[index]
+                match = search(key)
+                if match:
+                    cost = match_cost(key, query, match)
+                    if cost in buckets:
+                        buckets[cost].append(index)
+                    else:
+                        buckets[cost] = [index]
+
+            if len(chunk) < CHUNK_SIZE:
+                self.done = True
+                break
+            if time.perf_counter() >= deadline:
+                break
+
+        self.matches = list(chain.from_iterable(buckets[cost] for cost in sorted(buckets)))
+
+        if self.done:
+            self._cache[query] = self.matches
+        return self.done
+
+    def matched_items(self):
+        """ Items of the current matches, best first """
+        return list(map(self.items.__getitem__, self.matches))
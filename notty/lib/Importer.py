@@ -0,0 +1,247 @@
+"""
+    Streaming import of notes.
+
+    Sources are read lazily and flow through a pipeline of generators:
+    files are found, parsed into notes on a process pool, deduplicated by
+    content hash and written in batched transactions. Nothing but a few
+    batches is held in memory, whatever the size of the archive.
+
+    Every imported note is recorded in the import log together with its
+    content hash in the same transaction, so an interrupted import is
+    resumed by running it again: notes which are already in are skipped.
+"""
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from notty.utils.content_hash import content_hash
+from notty.utils.timestamps import format_epoch, parse_legacy_ts
+import json
+import os
+import tarfile
+import time
+
+# Extensions of files which are imported from directories and tarballs
+NOTE_EXTENSIONS = (".md", ".markdown", ".txt")
+
+# Extensions of JSON Lines files, one note per line
+JSONL_EXTENSIONS = (".jsonl", ".ndjson")
+
+# Sources parsed by one task of a worker process
+PARSE_CHUNK = 256
+
+# Notes written by one transaction
+WRITE_BATCH = 1000
+
+
+def read_text(data):
+    return data.decode("utf-8", errors="replace")
+
+
+def split_markdown(name, text):
+    """
+    Splits a Markdown or text file into a title and a text.
+
+    A leading `# Heading` becomes the title, otherwise the file's name does.
+    Only the blank line the exporter puts after the heading is dropped,
+    blank lines the text starts with are kept
+    """
+    stripped = text.lstrip("\ufeff\r\n")
+    first_line, _, rest = stripped.partition("\n")
+    if first_line.startswith("# "):
+        if rest.startswith("\r\n"):
+            rest = rest[2:]
+        elif rest.startswith("\n"):
+            rest = rest[1:]
+        return first_line[2:].strip(), rest
+
+    title = os.path.splitext(os.path.basename(name))[0]
+    return title, text
+
+
+def parse_source(source):
+    """
+    Parses one source into `(hash, title, text, created_at, updated_at, key)`,
+    or into None if there is nothing to import
+
+    Runs in worker processes, so only takes and returns plain data.
+    """
+    kind, key, payload, mtime = source
+    updated_at = None
+
+    if kind == "file":
+        with open(payload, "rb") as file:
+            title, text = split_markdown(payload, read_text(file.read()))
+    elif kind == "blob":
+        title, text = split_markdown(key, read_text(payload))
+    elif kind == "json":
+        entry = json.loads(payload)
+        if not isinstance(entry, dict):
+            return None
+        title, text = str(entry.get("title") or ""), str(entry.get("text") or "")
+        created_at = entry.get("created_at")
+        if not isinstance(created_at, int):
+            created_at = parse_legacy_ts(entry.get("ts"))
+        updated_at = entry.get("updated_at")
+        mtime = created_at or mtime
+    else:
+        raise ValueError(f"Unknown source kind: {kind}")
+
+    if not title and not text.strip():
+        return None
+
+    created_at = int(mtime)
+    if not isinstance(updated_at, int):
+        updated_at = created_at
+
+    digest = content_hash(f"{title}\0{text}")
+    return digest, title, text, created_at, updated_at, key
+
+
+def parse_sources(sources):
+    """
+    Parses a chunk of sources, returns parsed notes and `(key, error)`
+    of sources which are broken instead of raising
+    """
+    notes, errors = [], []
+    for source in sources:
+        try:
+            note = parse_source(source)
+        except (OSError, ValueError, UnicodeError) as e:
+            errors.append((source[1], str(e)))
+            continue
+        if note is not None:
+            notes.append(note)
+    return notes, errors
+
+
+def walk_directory(root):
+    """ Yields note files found in a directory tree, in a stable order """
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.lower().endswith(NOTE_EXTENSIONS):
+                path = os.path.join(dirpath, filename)
+                yield "file", path, path, os.path.getmtime(path)
+
+
+def walk_tarball(path):
+    """ Yields note files of a (possibly compressed) tarball, streaming it """
+    with tarfile.open(path, "r|*") as tar:
+        for member in tar:
+            if member.isfile() and member.name.lower().endswith(NOTE_EXTENSIONS):
+                data = tar.extractfile(member).read()
+                yield "blob", f"{path}:{member.name}", data, member.mtime
+
+
+def walk_jsonl(path):
+    """ Yields lines of a JSON Lines file """
+    mtime = os.path.getmtime(path)
+    with open(path, encoding="utf-8") as file:
+        for number, line in enumerate(file, 1):
+            if line.strip():
+                yield "json", f"{path}:{number}", line, mtime
+
+
+def walk_path(path):
+    """ Yields sources of a directory, a tarball, a JSONL file or a single note """
+    if os.path.isdir(path):
+        return walk_directory(path)
+    if path.lower().endswith(JSONL_EXTENSIONS):
+        return walk_jsonl(path)
+    if tarfile.is_tarfile(path):
+        return walk_tarball(path)
+    return iter([("file", path, path, os.path.getmtime(path))])
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class Importer:
+    """
+    Imports notes from directories, tarballs and JSONL files.
+
+    :param jobs: Worker processes parsing files, 1 parses in this process
+    :param on_progress: Called with the importer after every written batch
+    :ivar failed: `(key, error)` of sources which couldn't be parsed
+    """
+
+    def __init__(self, db, jobs=None, batch_size=WRITE_BATCH, on_progress=None):
+        self.db = db
+        self.jobs = jobs or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.on_progress = on_progress
+
+        self.imported = 0
+        self.skipped = 0
+        self.failed = []
+        self.started_at = None
+
+    @property
+    def rate(self):
+        """ Notes processed per second """
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0
+        return (self.imported + self.skipped) / elapsed if elapsed else 0
+
+    def run(self, paths):
+        """ Imports everything found at given paths """
+        self.started_at = time.monotonic()
+        sources = (source for path in paths for source in walk_path(path))
+        chunks = chunked(sources, PARSE_CHUNK)
+
+        if self.jobs == 1:
+            self._write(self._unpack(map(parse_sources, chunks)))
+            return self
+
+        with ProcessPoolExecutor(max_workers=self.jobs) as pool:
+            self._write(self._unpack(self._parse_parallel(pool, chunks)))
+        return self
+
+    def _parse_parallel(self, pool, chunks):
+        """
+        Parses chunks on the pool in order, keeping only a few of them in
+        flight, unlike `pool.map()`, which would read all sources upfront
+        """
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(parse_sources, chunk))
+            if len(pending) >= self.jobs * 2:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
+    def _unpack(self, parsed_chunks):
+        for notes, errors in parsed_chunks:
+            self.failed.extend(errors)
+            yield from notes
+
+    def _write(self, notes):
+        for batch in chunked(notes, self.batch_size):
+            imported = self.db.get_imported(note[0] for note in batch)
+
+            # Duplicates within a batch are skipped too
+            fresh = {}
+            for note in batch:
+                if note[0] not in imported and note[0] not in fresh:
+                    fresh[note[0]] = note
+            self.skipped += len(batch) - len(fresh)
+
+            with self.db.transaction():
+                ids = self.db.insert_many(
+                    (title, text, format_epoch(created_at), created_at, updated_at)
+                    for _, title, text, created_at, updated_at, _ in fresh.values()
+                )
+                self.db.log_imports(
+                    (digest, id, note[5]) for (digest, note), id in zip(fresh.items(), ids)
+                )
+            self.imported += len(ids)
+
+            if self.on_progress:
+                self.on_progress(self)
@@ -0,0 +1,184 @@
+"""
+    Read-mostly viewer for large notes.
+
+    A `TextArea` splits its whole text into lines on every change and
+    render, which is slow for notes of many megabytes. This control keeps
+    the text as one string, finds line starts lazily, only as far as
+    the view has been scrolled, and renders just the visible lines.
+"""
+
+from bisect import bisect_right
+
+from prompt_toolkit.data_structures import Point
+from prompt_toolkit.key_binding import KeyBindings
+from prompt_toolkit.layout.controls import UIContent, UIControl
+from prompt_toolkit.mouse_events import MouseEvent, MouseEventType
+
+# Notes with more characters or lines than this are shown by the viewer
+LARGE_NOTE_SIZE = 1000000
+LARGE_NOTE_LINES = 20000
+
+# Characters of a line which are rendered, longer lines are cut
+MAX_LINE_LENGTH = 1000
+
+# Characters of the text split into lines at once, and count of chunks kept split
+INDEX_CHUNK = 256 * 1024
+CACHED_CHUNKS = 4
+
+
+def is_large(text):
+    """ Tells if a text is too large for a `TextArea`, without splitting it """
+    return len(text) > LARGE_NOTE_SIZE or text.count("\n", 0, LARGE_NOTE_SIZE) >= LARGE_NOTE_LINES
+
+
+class LineIndex:
+    """
+    Lines of a text, found chunk by chunk only as far as they are asked for.
+
+    Only the starts of chunks are kept for the whole text, lines are split
+    out of the few chunks which were viewed last.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.line_count = text.count("\n") + 1
+        self._offsets = [0]
+        self._first_lines = [0]
+        self._cache = {}
+
+    def _find_chunk(self, line):
+        """ Returns the index of the chunk which holds a line """
+        text, offsets, first_lines = self.text, self._offsets, self._first_lines
+
+        while first_lines[-1] <= line:
+            start = offsets[-1]
+            end = text.rfind("\n", start, start + INDEX_CHUNK)
+            if end == -1:
+                end = text.find("\n", start + INDEX_CHUNK)
+            if end == -1:
+                break
+
+            offsets.append(end + 1)
+            first_lines.append(first_lines[-1] + text.count("\n", start, end + 1))
+
+        return bisect_right(first_lines, line) - 1
+
+    def _get_chunk_lines(self, chunk):
+        lines = self._cache.get(chunk)
+        if lines is None:
+            start = self._offsets[chunk]
+            end = self._offsets[chunk + 1] - 1 if chunk + 1 < len(self._offsets) else None
+            lines = self.text[start:end].split("\n")
+
+            if len(self._cache) >= CACHED_CHUNKS:
+                del self._cache[next(iter(self._cache))]
+            self._cache[chunk] = lines
+        return lines
+
+    def get_line(self, line):
+        """ Returns a line without its line break """
+        chunk = self._find_chunk(line)
+        return self._get_chunk_lines(chunk)[line - self._first_lines[chunk]]
+
+    def get_offset(self, line):
+        """ Returns the offset of a line's start in the text """
+        chunk = self._find_chunk(line)
+        lines = self._get_chunk_lines(chunk)[: line - self._first_lines[chunk]]
+        return self._offsets[chunk] + sum(map(len, lines)) + len(lines)
+
+
+class LargeTextControl(UIControl):
+    """
+    Shows a text with line numbers, scrolled by moving the current line.
+
+    :param on_edit: Called when the user asks to edit the text
+    """
+
+    def __init__(self, on_edit=None):
+        self.on_edit = on_edit
+        self.index = LineIndex("")
+        self.cursor_line = 0
+        self._page_height = 1
+
+    @property
+    def text(self):
+        return self.index.text
+
+    @text.setter
+    def text(self, text):
+        self.index = LineIndex(text)
+        self.cursor_line = 0
+
+    def get_line_offset(self, line):
+        return self.index.get_offset(line)
+
+    def is_focusable(self):
+        return True
+
+    def create_content(self, width, height):
+        self._page_height = max(1, height)
+        index = self.index
+        digits = len(str(index.line_count))
+
+        def get_line(line):
+            text = index.get_line(line)
+            if len(text) > MAX_LINE_LENGTH:
+                text = text[:MAX_LINE_LENGTH] + "…"
+            return [
+                ("class:line-number", f"{line + 1:>{digits}} "),
+                ("", text.replace("\t", "    ")),
+            ]
+
+        return UIContent(
+            get_line=get_line,
+            line_count=index.line_count,
+            cursor_position=Point(x=0, y=self.cursor_line),
+            show_cursor=False,
+        )
+
+    def move(self, lines):
+        self.cursor_line = max(0, min(self.index.line_count - 1, self.cursor_line + lines))
+
+    def mouse_handler(self, mouse_event: MouseEvent):
+        if mouse_event.event_type == MouseEventType.SCROLL_UP:
+            self.move(-3)
+        elif mouse_event.event_type == MouseEventType.SCROLL_DOWN:
+            self.move(3)
+        else:
+            return NotImplemented
+
+    def get_key_bindings(self):
+        kb = KeyBindings()
+
+        @kb.add("up")
+        def _(event):
+            self.move(-1)
+
+        @kb.add("down")
+        def _(event):
+            self.move(1)
+
+        @kb.add("pageup")
+        def _(event):
+            self.move(-self._page_height)
+
+        @kb.add("pagedown")
+        def _(event):
+            self.move(self._page_height)
+
+        @kb.add("home")
+        @kb.add("c-home")
+        def _(event):
+            self.cursor_line = 0
+
+        @kb.add("end")
+        @kb.add("c-end")
+        def _(event):
+            self.cursor_line = self.index.line_count - 1
+
+        @kb.add("enter")
+        def _(event):
+            if self.on_edit:
+                self.on_edit()
+
+        return kb
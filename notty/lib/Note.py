@@ -0,0 +1,61 @@
+"""
+    Compact records of notes.
+
+    Records use `__slots__`, so a loaded note costs a fixed-size object
+    instead of a dict. The list screen keeps a summary of every loaded
+    note for the whole session, texts are loaded only for the opened note.
+"""
+
+
+class NoteSummary:
+    """ A note without its text, as it is listed in the sidebar """
+
+    __slots__ = ("id", "title", "created_at", "updated_at", "is_modified", "is_marked")
+
+    def __init__(self, id, title, created_at=None, updated_at=None):
+        self.id = id
+        self.title = title
+        self.created_at = created_at
+        self.updated_at = updated_at
+
+        # The note has changes which are not saved yet
+        self.is_modified = False
+
+        # The note is marked in the sidebar for a bulk action
+        self.is_marked = False
+
+    def update(self, **fields):
+        for name, value in fields.items():
+            setattr(self, name, value)
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in ("id", "title", "created_at", "updated_at")}
+
+    def __repr__(self):
+        return f"{type(self).__name__}(id={self.id!r}, title={self.title!r})"
+
+
+class Note(NoteSummary):
+    """ A note with its text """
+
+    __slots__ = ("text",)
+
+    def __init__(self, id, title, text, created_at=None, updated_at=None):
+        super().__init__(id, title, created_at, updated_at)
+        self.text = text
+
+    def to_dict(self):
+        return dict(super().to_dict(), text=self.text)
+
+
+class SearchResult(NoteSummary):
+    """ A note found by a full-text search, with a snippet of the matched text """
+
+    __slots__ = ("snippet",)
+
+    def __init__(self, id, title, created_at, updated_at, snippet):
+        super().__init__(id, title, created_at, updated_at)
+        self.snippet = snippet
+
+    def to_dict(self):
+        return dict(super().to_dict(), snippet=self.snippet)
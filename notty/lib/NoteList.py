@@ -0,0 +1,143 @@
+"""
+    Lazy, paged list of note summaries.
+
+    Backs the sidebar of the list screen: only summaries of notes are
+    fetched, newest (or most recently edited) first, one keyset-paginated
+    page at a time.
+    With a search query set, pages of the best matches are fetched instead.
+"""
+
+# Summaries fetched by one query
+PAGE_SIZE = 200
+
+
+class NoteList:
+    def __init__(self, db, page_size=PAGE_SIZE, query=None, order="created"):
+        self.db = db
+        self.page_size = page_size
+        self.query = query
+        self.order = order
+        self.exhausted = False
+        self._items = []
+        self._fetched = 0
+
+        # Bumped on every change, lets views cache what they render
+        self.version = 0
+
+        # `(time, id)` of the last fetched note, next page starts right after it
+        self._cursor = None
+
+    def load_page(self):
+        """ Fetches the next page, returns False if there is nothing left """
+        if self.exhausted:
+            return False
+        return self._add_page(self._fetch_page(*self._position()))
+
+    async def load_page_async(self, async_db):
+        """
+        Like `load_page()`, but the page is fetched through `AsyncNotes` off
+        the event loop. It is dropped if the list was reset or paged meanwhile
+        """
+        if self.exhausted:
+            return False
+
+        position = self._position()
+        page = await async_db.run("loading", self._fetch_page, *position)
+        if position != self._position() or self.exhausted:
+            return True
+        return self._add_page(page)
+
+    def _position(self):
+        return self.query, self.order, self._cursor, self._fetched
+
+    def _fetch_page(self, query, order, cursor, fetched):
+        if query:
+            return self.db.search(query, limit=self.page_size, offset=fetched)
+        return self.db.get_page(before=cursor, limit=self.page_size, order=order)
+
+    def _add_page(self, page):
+        if len(page) < self.page_size:
+            self.exhausted = True
+        if page:
+            last = page[-1]
+            self._cursor = (getattr(last, f"{self.order}_at"), last.id)
+            self._fetched += len(page)
+            self._items.extend(page)
+            self.version += 1
+
+        return bool(page)
+
+    def show(self, items):
+        """ Shows a given list of notes instead of paging through the DB """
+        self.query = None
+        self.exhausted = True
+        self._items = items
+        self.version += 1
+
+    def reset(self, query=None, order=None):
+        """ Drops loaded notes and starts over, optionally with a search query """
+        self.query = query
+        if order is not None:
+            self.order = order
+        self.exhausted = False
+        self._items = []
+        self._fetched = 0
+        self._cursor = None
+        self.version += 1
+
+    def ensure(self, index):
+        """ Loads pages until `index` is loaded or no notes are left """
+        while index >= len(self._items) and self.load_page():
+            pass
+        return index < len(self._items)
+
+    async def ensure_async(self, index, async_db):
+        """ Like `ensure()`, but pages are fetched off the event loop """
+        while index >= len(self._items) and await self.load_page_async(async_db):
+            pass
+        return index < len(self._items)
+
+    async def ensure_all_async(self, async_db):
+        while await self.load_page_async(async_db):
+            pass
+
+    def insert(self, index, note):
+        self._items.insert(index, note)
+        self.version += 1
+
+    def update(self, index, **fields):
+        self._items[index].update(**fields)
+        self.version += 1
+
+    def remove(self, indexes):
+        """ Removes loaded notes at given indexes """
+        indexes = set(indexes)
+        self._items = [note for index, note in enumerate(self._items) if index not in indexes]
+
+        # Search pages are fetched by offset, which moves back with removed notes
+        self._fetched -= len(indexes)
+        self.version += 1
+
+    def find(self, id):
+        """ Returns the index of a loaded note with a given ID or None """
+        for index, note in enumerate(self._items):
+            if note.id == id:
+                return index
+        return None
+
+    def __getitem__(self, index):
+        if index >= 0:
+            self.ensure(index)
+        return self._items[index]
+
+    def __delitem__(self, index):
+        del self._items[index]
+        self._fetched -= 1
+        self.version += 1
+
+    def __len__(self):
+        """ Count of the loaded notes """
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
@@ -0,0 +1,152 @@
+"""
+    Write-behind queue for note texts.
+"""
+
+from notty.lib.AsyncNotes import AsyncNotes
+from notty.utils import tracing
+import asyncio
+import time
+
+# Seconds of quiet after the last change before pending saves are written
+DEBOUNCE = 1.0
+
+# Pending saves are written at least this often, even while typing
+MAX_DELAY = 60
+
+# Seconds before a failed write (e.g. of a locked database) is tried again
+RETRY_DELAY = 5
+
+
+class SaveQueue:
+    """
+    Collects note saves and writes them off the UI thread.
+
+    Repeated saves of the same note are coalesced, so only its latest text
+    is written. Pending saves are written in a single transaction on
+    a worker thread once no save was queued for `debounce` seconds.
+
+    `db` is `Notes`, or the `AsyncNotes` of a screen to share its writer
+    thread, so that saves are shown as being in progress like other writes.
+    """
+
+    def __init__(self, db, debounce=DEBOUNCE, max_delay=MAX_DELAY, on_saved=None, on_error=None):
+        self._owns_db = not isinstance(db, AsyncNotes)
+        self.db = AsyncNotes(db) if self._owns_db else db
+        self.debounce = debounce
+        self.max_delay = max_delay
+
+        # Called on the event loop with `{id: text}` of every written batch
+        self.on_saved = on_saved
+
+        # Called on the event loop with the exception of every failed
+        # write started by the timer or `try_flush()`, which is then tried again
+        self.on_error = on_error
+
+        self._pending = {}
+        self._writing = {}
+        self._pending_since = None
+        self._timer = None
+        self._flushing = None
+
+        # `time.monotonic()` before which a failed write isn't tried again by the timer
+        self._retry_at = None
+
+    def put(self, id, text):
+        """ Queues the text of the note with a given ID to be saved """
+        if not self._pending:
+            self._pending_since = time.monotonic()
+        self._pending[id] = text
+        self._schedule()
+
+    def discard(self, id):
+        """ Drops a pending save, e.g. of a deleted note """
+        self._pending.pop(id, None)
+
+    def get(self, id):
+        """ Returns the queued text of a note which is not written yet, or None """
+        if id in self._pending:
+            return self._pending[id]
+        return self._writing.get(id)
+
+    def is_pending(self, id):
+        return id in self._pending
+
+    def _schedule(self):
+        if self._timer:
+            self._timer.cancel()
+
+        now = time.monotonic()
+        if self._retry_at is not None:
+            # A failed write is tried again at its time, changes don't move it
+            delay = max(0, self._retry_at - now)
+        else:
+            deadline = self._pending_since + self.max_delay - now
+            delay = max(0, min(self.debounce, deadline))
+        loop = asyncio.get_event_loop()
+        self._timer = loop.call_later(delay, lambda: asyncio.ensure_future(self._flush_later()))
+
+    async def _flush_later(self):
+        # Nothing awaits a flush started by the timer
+        await self.try_flush()
+
+    async def try_flush(self):
+        """
+        Like `flush()`, but a failed write is passed to `on_error` and tried
+        again later instead of raising. Returns True if everything was written
+        """
+        try:
+            await self.flush()
+        except Exception as error:
+            if self.on_error:
+                self.on_error(error)
+            self._retry_at = time.monotonic() + RETRY_DELAY
+            if self._pending:
+                self._schedule()
+            return False
+        return True
+
+    async def flush(self):
+        """ Writes every pending save, waiting for a write in progress first """
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+
+        # Batches are written one after another. A failed batch is put back
+        # to the pending ones by its own flush, and written with them here
+        while self._flushing:
+            await asyncio.wait([self._flushing])
+
+        if not self._pending:
+            return
+
+        batch, self._pending = self._pending, {}
+        self._writing = batch
+        started = time.perf_counter()
+        self._flushing = asyncio.ensure_future(self.db.update_texts(batch))
+
+        try:
+            await self._flushing
+        except Exception:
+            # Keep the batch for the next flush, newer saves of the same notes win
+            batch.update(self._pending)
+            self._pending = batch
+            raise
+        finally:
+            self._flushing = None
+            self._writing = {}
+            tracing.add("autosave", "save", started, notes=len(batch))
+
+        self._retry_at = None
+        if self.on_saved:
+            self.on_saved(batch)
+
+    async def close(self):
+        """ Flushes pending saves and stops the worker thread, unless it is shared """
+        try:
+            await self.flush()
+        finally:
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+            if self._owns_db:
+                self.db.close()
@@ -0,0 +1,123 @@
+"""
+    Cache of note texts for the list screen.
+"""
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from notty.utils import tracing
+import sys
+import threading
+import time
+
+# Memory (in bytes) taken by cached texts at most
+MAX_SIZE = 32 * 1024 * 1024
+
+# Texts larger than this (in bytes) are neither cached nor prefetched,
+# so one huge note doesn't evict every other one
+MAX_TEXT_SIZE = 2 * 1024 * 1024
+
+
+class TextCache:
+    """
+    LRU cache of note texts, bounded by the memory the texts take.
+
+    Texts of notes around the selected one are prefetched on a worker
+    thread, which reads them through the engine's reader pool, so moving
+    through the sidebar finds them already loaded. Prefetch requests made
+    while one is running replace each other, only the latest one is read.
+    """
+
+    def __init__(self, db, max_size=MAX_SIZE, max_text_size=MAX_TEXT_SIZE):
+        self.db = db
+        self.max_size = max_size
+        self.max_text_size = max_text_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+        self._texts = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._wanted = None
+        self._prefetching = False
+
+        # IDs of notes changed while a prefetch was reading, the texts
+        # it read for them may be stale and are dropped
+        self._changed = set()
+
+    def get(self, id):
+        """ Returns the cached text of a note, or None """
+        with self._lock:
+            text = self._texts.get(id)
+            if text is None:
+                self.misses += 1
+                return None
+
+            self._texts.move_to_end(id)
+            self.hits += 1
+            return text
+
+    def put(self, id, text):
+        """ Caches the text of a note as it is stored in DB """
+        with self._lock:
+            self._changed.add(id)
+            self._store(id, text)
+
+    def discard(self, id):
+        """ Drops the text of a note, e.g. a deleted one """
+        with self._lock:
+            self._changed.add(id)
+            self._remove(id)
+
+    def prefetch(self, ids):
+        """ Loads texts of notes with given IDs which are not cached yet, in the background """
+        with self._lock:
+            self._wanted = [id for id in ids if id not in self._texts]
+            if not self._wanted or self._prefetching:
+                return
+            self._prefetching = True
+        self._executor.submit(self._run_prefetch)
+
+    def close(self):
+        self._executor.shutdown()
+
+    def _run_prefetch(self):
+        while True:
+            with self._lock:
+                ids, self._wanted = self._wanted, None
+                if not ids:
+                    self._prefetching = False
+                    return
+                self._changed = set()
+
+            started = time.perf_counter()
+            try:
+                texts = self.db.get_texts(ids, max_size=self.max_text_size)
+            except Exception:
+                texts = {}
+
+            with self._lock:
+                for id, text in texts.items():
+                    if id not in self._texts and id not in self._changed:
+                        self._store(id, text)
+            tracing.add("prefetch", "cache", started, notes=len(texts))
+
+    def _store(self, id, text):
+        self._remove(id)
+        if text is None:
+            return
+
+        size = sys.getsizeof(text)
+        if size > self.max_text_size:
+            return
+
+        self._texts[id] = text
+        self.size += size
+        while self.size > self.max_size:
+            _, evicted = self._texts.popitem(last=False)
+            self.size -= sys.getsizeof(evicted)
+
+    def _remove(self, id):
+        text = self._texts.pop(id, None)
+        if text is not None:
+            self.size -= sys.getsizeof(text)
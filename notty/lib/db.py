@@ -1,65 +1,1021 @@
 import sqlite3
 import appdirs
+import json
+from notty.lib import migrations
+from notty.lib.Note import Note, NoteSummary, SearchResult
+from notty.utils import compression, delta, tracing
+from notty.utils.metadata import PREVIEW_LENGTH, describe
+from notty.utils.timestamps import epoch_now
 import os
+import queue
+import threading
+import inspect
+import time
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
 
+# Read-only connections kept open next to the write connection
+READERS_COUNT = 2
 
-class Notes:
-    def __init__(self):
-        self.dirpath = os.path.join(appdirs.user_data_dir(), "notty")
-        self.path = os.path.join(self.dirpath, "main.db")
+# Prepared statements cached by every connection
+STATEMENT_CACHE_SIZE = 128
 
-        if not os.path.exists(self.dirpath):
-            os.makedirs(self.dirpath)
+# Seconds to wait for a lock held by another process before failing
+BUSY_TIMEOUT = 10
 
-        self.connection = sqlite3.connect(self.path, check_same_thread=False)
-        self.db = self.connection.cursor()
+# Sort orders of notes and columns they are sorted by, both are indexed
+ORDER_COLUMNS = {"created": "created_at", "updated": "updated_at"}
 
-        # Init the DB tables
-        self.db.execute(
-            """CREATE TABLE IF NOT EXISTS notes
-                   (id INTEGER PRIMARY KEY AUTOINCREMENT, title text NOT_NULL, text text NOT_NULL, ts text NOT_NULL);
-                   """
+# Text of a note, decompressed if it is stored compressed
+PLAIN_TEXT = "(CASE WHEN codec = 0 THEN text ELSE notty_text(text, codec) END)"
+
+# Every this many revisions of a note, the full text is kept instead of a delta,
+# so restoring a revision never applies more deltas than that
+KEYFRAME_INTERVAL = 20
+
+# Saves of a note made within this many seconds after its last revision
+# are merged into it, so autosave doesn't create a revision per keystroke
+REVISION_INTERVAL = 300
+
+# Columns of notes which `Notes.update_many()` can change
+UPDATABLE_COLUMNS = ("title", "text")
+
+# Columns set when the text of a note changes, in the order of
+# `compression.encode()` followed by `metadata.describe()`
+TEXT_ASSIGNMENTS = "text = ?, codec = ?, preview = ?, size = ?, lines = ?, words = ?, hash = ?"
+
+# Notes indexed by one transaction when an existing DB gets the search index
+SEARCH_INDEX_BATCH = 500
+
+# Queries at least this slow (in seconds) are kept in the `query_metrics` table
+METRICS_MIN_DURATION = 0.005
+
+# Newest rows kept in the `query_metrics` table
+METRICS_ROWS = 1000
+
+PRAGMAS = (
+    "PRAGMA synchronous = NORMAL;",  # Safe with WAL, fsyncs only on checkpoints
+    "PRAGMA cache_size = -16000;",  # 16 MiB of page cache
+    "PRAGMA mmap_size = 268435456;",  # Map up to 256 MiB of the file
+    "PRAGMA temp_store = MEMORY;",
+)
+
+
+class Engine:
+    """
+    Process-wide storage engine.
+
+    Owns a single write connection and a small pool of read-only connections
+    to the same database. The database runs in WAL mode, so readers never
+    block the writer and the writer never blocks readers.
+    """
+
+    def __init__(self, path, readers=READERS_COUNT):
+        self.path = path
+        self._write_lock = threading.RLock()
+        self._readers = queue.LifoQueue()
+        self._readers_lock = threading.Lock()
+        self._readers_opened = 0
+        self._max_readers = readers
+        self._closed = False
+        self._depth = 0
+        self.search_index_built = threading.Event()
+
+        # Slow queries which are not written to `query_metrics` yet
+        self._metrics = []
+
+        # Codec and threshold of compressed texts, off unless enabled
+        self.compression = compression.get_settings()
+
+        self.writer = self._connect(path)
+        self.writer.execute("PRAGMA journal_mode = WAL;")
+
+        migrations.migrate(self)
+
+        # Notes which existed before the search index are indexed in the background.
+        # Most runs have nothing to index, they don't take the write lock for it
+        if self._search_index_pending():
+            threading.Thread(target=self._build_search_index, daemon=True).start()
+        else:
+            self.search_index_built.set()
+
+    def _search_index_pending(self):
+        """ True if some notes are not in the search index yet """
+        with self.read() as connection:
+            indexed, until = connection.execute(
+                "SELECT indexed_upto, backfill_until FROM notes_fts_state;"
+            ).fetchone()
+        return indexed < until
+
+    def _build_search_index(self):
+        """ Indexes notes left from before the index existed, batch by batch """
+        while True:
+            with self._write_lock:
+                if self._closed:
+                    return
+
+                with self.write() as connection:
+                    indexed, until = connection.execute(
+                        "SELECT indexed_upto, backfill_until FROM notes_fts_state;"
+                    ).fetchone()
+                    if indexed >= until:
+                        return self.search_index_built.set()
+
+                    last = connection.execute(
+                        """SELECT max(id) FROM
+                           (SELECT id FROM notes WHERE id > ? AND id <= ? ORDER BY id LIMIT ?);
+                           """,
+                        (indexed, until, SEARCH_INDEX_BATCH),
+                    ).fetchone()[0]
+                    last = until if last is None else last
+
+                    connection.execute(
+                        """INSERT INTO notes_fts (rowid, title, text)
+                           SELECT id, title, notty_text(text, codec) FROM notes
+                           WHERE id > ? AND id <= ?;
+                           """,
+                        (indexed, last),
+                    )
+                    connection.execute(
+                        "UPDATE notes_fts_state SET indexed_upto = ?;", (last,)
+                    )
+
+    def _connect(self, database, **kwargs):
+        connection = sqlite3.connect(
+            database,
+            timeout=BUSY_TIMEOUT,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+            **kwargs,
         )
+        for pragma in PRAGMAS:
+            connection.execute(pragma)
 
-    def get_all(self):
-        data = self.db.execute("SELECT * FROM notes;")
-        data = data.fetchall()
-        res = []
+        # Used by the search index to read compressed texts
+        connection.create_function("notty_text", 2, compression.decode)
+        return connection
+
+    def _open_reader(self):
+        uri = Path(self.path).absolute().as_uri() + "?mode=ro"
+        connection = self._connect(uri, uri=True, isolation_level=None)
+        return connection
+
+    @contextmanager
+    def read(self):
+        """ Borrows a read-only connection from the pool """
+        try:
+            connection = self._readers.get_nowait()
+        except queue.Empty:
+            with self._readers_lock:
+                can_open = self._readers_opened < self._max_readers
+                if can_open:
+                    self._readers_opened += 1
+            connection = self._open_reader() if can_open else self._readers.get()
+
+        try:
+            yield connection
+        finally:
+            self._readers.put(connection)
 
-        for entry in data:
-            res.append(
-                {"id": entry[0], "title": entry[1], "text": entry[2], "ts": entry[3]}
+    @contextmanager
+    def write(self):
+        """
+        Takes the write connection and runs the block in one transaction,
+        which is committed on success and rolled back on error.
+
+        Blocks nested into another `write()` of the same thread run in
+        a savepoint: an error rolls back the nested block only, and the
+        work is committed by the outermost block.
+        """
+        with self._write_lock:
+            if self._depth:
+                savepoint = f"nested_{self._depth}"
+                self.writer.execute(f"SAVEPOINT {savepoint};")
+            else:
+                # Take the write lock upfront instead of upgrading a read lock
+                # later, which fails right away if another process writes
+                savepoint = None
+                self.writer.execute("BEGIN IMMEDIATE;")
+
+            self._depth += 1
+            try:
+                yield self.writer
+            except BaseException:
+                if savepoint:
+                    self.writer.execute(f"ROLLBACK TO {savepoint};")
+                    self.writer.execute(f"RELEASE {savepoint};")
+                else:
+                    self.writer.rollback()
+                raise
+            else:
+                if savepoint:
+                    self.writer.execute(f"RELEASE {savepoint};")
+                else:
+                    self.writer.commit()
+            finally:
+                self._depth -= 1
+
+    def vacuum(self):
+        """ Rebuilds the database file, returning free pages to the file system """
+        with self.write() as connection:
+            # Merges segments of the search index into one
+            connection.execute("INSERT INTO notes_fts (notes_fts) VALUES ('optimize');")
+
+        with self._write_lock:
+            self.writer.execute("VACUUM;")
+        self.checkpoint()
+
+    def checkpoint(self):
+        """ Moves the WAL into the database file and truncates the WAL """
+        with self._write_lock:
+            self.writer.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+
+    def record_query(self, name, duration, rows):
+        """ Keeps a query for `query_metrics` if it was slow, it is written on close """
+        if duration >= METRICS_MIN_DURATION:
+            self._metrics.append((name, epoch_now(), duration * 1000, rows))
+
+    def flush_metrics(self):
+        """ Writes recorded slow queries, dropping the oldest rows over `METRICS_ROWS` """
+        metrics, self._metrics = self._metrics, []
+        if not metrics:
+            return
+
+        with self.write() as connection:
+            connection.executemany(
+                "INSERT INTO query_metrics (name, created_at, duration, rows) VALUES (?, ?, ?, ?);",
+                metrics,
+            )
+            connection.execute(
+                "DELETE FROM query_metrics WHERE id <= (SELECT max(id) FROM query_metrics) - ?;",
+                (METRICS_ROWS,),
             )
-        return res
 
+    def close(self):
+        with self._write_lock:
+            try:
+                self.flush_metrics()
+            except sqlite3.Error:
+                # Losing metrics is better than failing to close
+                pass
+
+            self._closed = True
+            self.writer.close()
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def count_rows(result, args):
+    """ Rows returned by a query, or written by it when it returns nothing """
+    if result is None:
+        sized = args[0] if args else None
+        return len(sized) if isinstance(sized, (list, tuple, dict)) else 0
+    if isinstance(result, (list, tuple, dict)):
+        return len(result)
+    return 1
+
+
+def measured(method):
+    """
+    Records the duration and row count of every call of a `Notes` method
+    for `notty stats` and for tracing. Generators are timed only while
+    they run, not while their caller handles the rows
+    """
+    name = method.__name__
+
+    def record(self, started, duration, rows):
+        self.engine.record_query(name, duration, rows)
+        tracing.add(name, "db", started, started + duration, rows=rows)
+
+    if inspect.isgeneratorfunction(method):
+
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            iterator = method(self, *args, **kwargs)
+            started = time.perf_counter()
+            duration = rows = 0
+            try:
+                while True:
+                    resumed = time.perf_counter()
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        break
+                    finally:
+                        duration += time.perf_counter() - resumed
+                    rows += 1
+                    yield item
+            finally:
+                iterator.close()
+                record(self, started, duration, rows)
+
+    else:
+
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            started = time.perf_counter()
+            result = method(self, *args, **kwargs)
+            record(self, started, time.perf_counter() - started, count_rows(result, args))
+            return result
+
+    return wrapper
+
+
+def match_query(query):
+    """ Turns user input into an FTS5 query matching every word as a prefix """
+    return " ".join('"{}"*'.format(word.replace('"', '""')) for word in query.split())
+
+
+def default_path():
+    dirpath = os.path.join(appdirs.user_data_dir(), "notty")
+
+    if not os.path.exists(dirpath):
+        os.makedirs(dirpath)
+
+    return os.path.join(dirpath, "main.db")
+
+
+def get_engine():
+    """ Returns the process-wide storage engine, opening it on first use """
+    global _engine
+
+    with _engine_lock:
+        if _engine is None:
+            _engine = Engine(default_path())
+        return _engine
+
+
+def close_engine():
+    """ Closes the process-wide storage engine if it was opened """
+    global _engine
+
+    with _engine_lock:
+        if _engine is not None:
+            _engine.close()
+            _engine = None
+
+
+class Notes:
+    """
+    Notes storage.
+
+    Every instance goes through the process-wide `Engine`, which is opened
+    lazily on the first query, so creating an instance is free.
+    """
+
+    def __init__(self, engine=None):
+        self._engine = engine
+
+    @property
+    def engine(self):
+        return self._engine or get_engine()
+
+    @property
+    def path(self):
+        return self.engine.path
+
+    @measured
+    def get_all(self):
+        """ Returns every note with its text as `Note` records """
+        with self.engine.read() as connection:
+            data = connection.execute(
+                "SELECT id, title, text, created_at, updated_at, codec FROM notes;"
+            ).fetchall()
+
+        decode = compression.decode
+        return [
+            Note(id, title, decode(text, codec), created_at, updated_at)
+            for id, title, text, created_at, updated_at, codec in data
+        ]
+
+    @measured
     def get(self, id):
-        data = self.db.execute(f"SELECT * FROM notes WHERE id = {id};")
-        data = data.fetchone()
+        with self.engine.read() as connection:
+            data = connection.execute(
+                "SELECT id, title, text, created_at, updated_at, codec FROM notes WHERE id = ?;",
+                (id,),
+            )
+            data = data.fetchone()
 
         if not data:
             return None
+        return Note(data[0], data[1], compression.decode(data[2], data[5]), data[3], data[4])
+
+    @measured
+    def get_page(self, before=None, limit=200, order="created", since=None, until=None):
+        """
+        Returns `NoteSummary` records (no text) of up to `limit` notes, newest first
+        by `order` ("created" or "updated"), served by the column's index.
+
+        :param before: `(time, id)` of the last note of the previous page
+        :param since: Only notes created (or updated) at or after this epoch
+        :param until: Only notes created (or updated) before this epoch
+        """
+        column = ORDER_COLUMNS[order]
+        conditions, params = [], []
+
+        if before is not None:
+            conditions.append(f"({column}, id) < (?, ?)")
+            params.extend(before)
+        if since is not None:
+            conditions.append(f"{column} >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append(f"{column} < ?")
+            params.append(until)
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self.engine.read() as connection:
+            data = connection.execute(
+                f"""SELECT id, title, created_at, updated_at FROM notes {where}
+                    ORDER BY {column} DESC, id DESC LIMIT ?;
+                    """,
+                params + [limit],
+            ).fetchall()
+
+        return [NoteSummary(*entry) for entry in data]
+
+    @measured
+    def iter_previews(
+        self,
+        order="created",
+        since=None,
+        until=None,
+        grep=None,
+        limit=-1,
+        offset=0,
+        preview=PREVIEW_LENGTH,
+        chunk_size=200,
+    ):
+        """
+        Yields summaries of notes with a `preview` of their first characters,
+        newest first by `order`, streamed from one cursor in chunks.
+        Previews up to `PREVIEW_LENGTH` come from the stored `preview` column,
+        so texts are not read at all (except to `grep` them). Longer ones
+        are cut by SQLite, so full texts never reach Python.
+
+        :param grep: Only notes whose title or text contain this, ignoring case
+        """
+        column = ORDER_COLUMNS[order]
+        conditions, params = [], []
+
+        if since is not None:
+            conditions.append(f"{column} >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append(f"{column} < ?")
+            params.append(until)
+        if grep:
+            pattern = "%{}%".format(
+                grep.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            )
+            conditions.append(f"(title LIKE ? ESCAPE '\\' OR {PLAIN_TEXT} LIKE ? ESCAPE '\\')")
+            params.extend((pattern, pattern))
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        if preview <= PREVIEW_LENGTH:
+            # The text is cut if it has more bytes than the preview
+            selected = "preview, size"
         else:
-            return {"id": data[0], "title": data[1], "text": data[2], "ts": data[3]}
+            # One more character tells if the preview is cut
+            selected = f"coalesce(substr({PLAIN_TEXT}, 1, {int(preview) + 1}), ''), NULL"
+
+        with self.engine.read() as connection:
+            cursor = connection.execute(
+                f"""SELECT id, title, created_at, updated_at, {selected}
+                    FROM notes {where}
+                    ORDER BY {column} DESC, id DESC LIMIT ? OFFSET ?;
+                    """,
+                params + [limit, offset],
+            )
+            try:
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    for entry in rows:
+                        text = entry[4][:preview]
+                        if entry[5] is None:
+                            is_cut = len(entry[4]) > preview
+                        else:
+                            is_cut = entry[5] > len(text.encode("utf-8"))
+                        yield {
+                            "id": entry[0],
+                            "title": entry[1],
+                            "created_at": entry[2],
+                            "updated_at": entry[3],
+                            "preview": text,
+                            "is_cut": is_cut,
+                        }
+            finally:
+                cursor.close()
+
+    @measured
+    def iter_notes(self, since=None, ids=None, chunk_size=500):
+        """
+        Yields full notes in order of their IDs, reading them in chunks with
+        one cursor, so memory stays flat whatever the count of notes.
+        All notes come from one snapshot of the DB, even if it's written meanwhile.
+
+        :param since: Only notes updated at or after this epoch
+        :param ids: Only notes with these IDs
+        """
+        conditions, params = [], []
+        if since is not None:
+            conditions.append("updated_at >= ?")
+            params.append(since)
+        if ids is not None:
+            # Reads IDs from a JSON array, there could be more of them than bound parameters
+            conditions.append("id IN (SELECT value FROM json_each(?))")
+            params.append(json.dumps(sorted(set(ids))))
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self.engine.read() as connection:
+            # A single statement reads from one snapshot until it is reset
+            cursor = connection.execute(
+                f"""SELECT id, title, text, created_at, updated_at, codec FROM notes {where}
+                    ORDER BY id;
+                    """,
+                params,
+            )
+            try:
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    for entry in rows:
+                        yield {
+                            "id": entry[0],
+                            "title": entry[1],
+                            "text": compression.decode(entry[2], entry[5]),
+                            "created_at": entry[3],
+                            "updated_at": entry[4],
+                        }
+            finally:
+                cursor.close()
+
+    @measured
+    def search(self, query, limit=50, offset=0, highlight=("[", "]")):
+        """
+        Full-text search over notes' titles and texts, best matches first.
+        Returns `SearchResult` records with a `snippet` of the matched text, where matches
+        are wrapped into `highlight` markers
+        """
+        match = match_query(query)
+        if not match:
+            return []
+
+        with self.engine.read() as connection:
+            data = connection.execute(
+                """SELECT notes.id, notes.title, notes.created_at, notes.updated_at,
+                          snippet(notes_fts, -1, ?, ?, '...', 16)
+                   FROM notes_fts JOIN notes ON notes.id = notes_fts.rowid
+                   WHERE notes_fts MATCH ?
+                   ORDER BY bm25(notes_fts, 10.0, 1.0) LIMIT ? OFFSET ?;
+                   """,
+                (highlight[0], highlight[1], match, limit, offset),
+            ).fetchall()
+
+        return [SearchResult(*entry) for entry in data]
+
+    @measured
+    def get_text(self, id):
+        """ Returns the text of a note, it is decompressed only here, when the note is opened """
+        with self.engine.read() as connection:
+            data = connection.execute("SELECT text, codec FROM notes WHERE id = ?;", (id,))
+            data = data.fetchone()
+
+        return compression.decode(*data) if data else None
+
+    @measured
+    def get_texts(self, ids, max_size=None):
+        """
+        Returns `{id: text}` of notes with given IDs, read by one query
+
+        :param max_size: Leave out texts larger than this many bytes
+        """
+        ids = list(ids)
+        if not ids:
+            return {}
+
+        where = f"id IN ({', '.join('?' * len(ids))})"
+        if max_size is not None:
+            where += " AND size <= ?"
+            ids.append(max_size)
+
+        with self.engine.read() as connection:
+            rows = connection.execute(
+                f"SELECT id, text, codec FROM notes WHERE {where};", ids
+            ).fetchall()
+
+        return {id: compression.decode(value, codec) for id, value, codec in rows}
+
+    @measured
+    def get_metadata(self, id):
+        """
+        Returns `{"size", "lines", "words", "hash"}` of a note's saved text,
+        kept up to date on every write, so the text is not read. None if
+        there is no such note
+        """
+        with self.engine.read() as connection:
+            data = connection.execute(
+                "SELECT size, lines, words, hash FROM notes WHERE id = ?;", (id,)
+            ).fetchone()
+
+        return dict(zip(("size", "lines", "words", "hash"), data)) if data else None
+
+    def transaction(self):
+        """
+        Groups writes into one transaction, committed (and synced) once
+        at the end of the `with` block or rolled back on error:
+
+            with db.transaction():
+                db.update_title(id, title)
+                db.delete_many(ids)
+        """
+        return self.engine.write()
 
     def insert(self, data):
-        self.db.execute(f"INSERT INTO notes (title, text, ts) VALUES (?, ?, ?);", data)
-        self.connection.commit()
-        return self.db.lastrowid
+        """ Inserts a note from `(title, text, ts)`, returns its ID """
+        return self.insert_many([data])[0]
 
-    def update_text(self, id, text):
-        self.db.execute(f'UPDATE notes SET text = "{text}" WHERE id = {id};')
-        self.connection.commit()
+    @measured
+    def insert_many(self, notes):
+        """
+        Inserts notes in one transaction, returns their IDs.
+
+        :param notes: Iterable of `(title, text, ts[, created_at[, updated_at]])`,
+                      missing epochs default to the current time
+        """
+        # Texts are compressed and described before the write lock is taken
+        now = epoch_now()
+        rows = []
+        for note in notes:
+            title, text, ts = note[:3]
+            created_at = note[3] if len(note) > 3 else now
+            updated_at = note[4] if len(note) > 4 else created_at
+            value, codec = compression.encode(text, *self.engine.compression)
+            rows.append((title, value, ts, created_at, updated_at, codec) + describe(text))
+
+        ids = []
+        with self.engine.write() as connection:
+            for row in rows:
+                cursor = connection.execute(
+                    """INSERT INTO notes (title, text, ts, created_at, updated_at, codec,
+                                          preview, size, lines, words, hash)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+                       """,
+                    row,
+                )
+                ids.append(cursor.lastrowid)
+        return ids
+
+    @measured
+    def update_many(self, changes, merge_revisions=True):
+        """
+        Updates notes in one transaction. Replaced texts are kept as revisions.
+
+        :param changes: `{id: {"title": ..., "text": ...}}`, either field may be left out
+        :param merge_revisions: Merge saves which follow a recent revision into it
+        """
+        # Notes changing the same fields share one statement
+        groups = {}
+        for id, fields in changes.items():
+            columns = tuple(sorted(column for column in fields if column in UPDATABLE_COLUMNS))
+            if columns:
+                groups.setdefault(columns, []).append((id, fields))
+
+        # Texts are compressed and described before the write lock is taken
+        now = epoch_now()
+        statements = []
+        for columns, group in groups.items():
+            assignments = ", ".join(
+                TEXT_ASSIGNMENTS if column == "text" else f"{column} = ?" for column in columns
+            )
+            params = []
+            for id, fields in group:
+                values = []
+                for column in columns:
+                    if column == "text":
+                        values.extend(compression.encode(fields["text"], *self.engine.compression))
+                        values.extend(describe(fields["text"]))
+                    else:
+                        values.append(fields[column])
+                params.append(tuple(values) + (now, id))
+            statements.append((f"UPDATE notes SET {assignments}, updated_at = ? WHERE id = ?;", params))
+
+        texts = {id: fields["text"] for id, fields in changes.items() if "text" in fields}
+        with self.engine.write() as connection:
+            self._add_revisions(connection, texts, now, merge_revisions)
+            for statement, params in statements:
+                connection.executemany(statement, params)
         return self
 
+    def _add_revisions(self, connection, texts, now, merge):
+        """
+        Keeps the current texts of notes, which are about to be replaced by
+        `texts`, as their newest revisions.
+
+        Revisions are reverse deltas: the newest one turns the current text
+        into the previous one, and so on back in time. Every
+        `KEYFRAME_INTERVAL`th revision keeps its full text instead.
+        """
+        for id, text in texts.items():
+            row = connection.execute("SELECT text, codec FROM notes WHERE id = ?;", (id,)).fetchone()
+            if row is None:
+                continue
+            current = compression.decode(*row)
+            if current == text:
+                continue
+
+            last = connection.execute(
+                """SELECT number, created_at, is_keyframe, data FROM revisions
+                   WHERE note_id = ? ORDER BY number DESC LIMIT 1;
+                   """,
+                (id,),
+            ).fetchone()
+
+            if merge and last and now - last[1] < REVISION_INTERVAL:
+                # The newest revision stays as it is, only its delta is rebased on the new text
+                if not last[2]:
+                    previous = delta.apply_delta(current, delta.unpack(last[3]))
+                    connection.execute(
+                        "UPDATE revisions SET data = ? WHERE note_id = ? AND number = ?;",
+                        (delta.pack(delta.make_delta(text, previous)), id, last[0]),
+                    )
+                continue
+
+            number = last[0] + 1 if last else 1
+            is_keyframe = number % KEYFRAME_INTERVAL == 0
+            data = delta.pack(current if is_keyframe else delta.make_delta(text, current))
+            connection.execute(
+                """INSERT INTO revisions (note_id, number, created_at, is_keyframe, size, data)
+                   VALUES (?, ?, ?, ?, ?, ?);
+                   """,
+                (id, number, now, int(is_keyframe), len(current), data),
+            )
+
+    @measured
+    def get_revisions(self, id):
+        """ Returns revisions of a note, newest first, without their texts """
+        with self.engine.read() as connection:
+            data = connection.execute(
+                """SELECT number, created_at, size, is_keyframe, length(data) FROM revisions
+                   WHERE note_id = ? ORDER BY number DESC;
+                   """,
+                (id,),
+            ).fetchall()
+
+        return [
+            {
+                "number": entry[0],
+                "created_at": entry[1],
+                "size": entry[2],
+                "is_keyframe": bool(entry[3]),
+                "stored_size": entry[4],
+            }
+            for entry in data
+        ]
+
+    @measured
+    def get_revision_text(self, id, number):
+        """
+        Returns the text of a note as it was before revision `number`
+        was replaced, or None if there is no such revision
+        """
+        with self.engine.read() as connection:
+            # Deltas and the current text must come from one snapshot
+            connection.execute("BEGIN;")
+            try:
+                # Deltas are applied from the nearest newer keyframe, or from the current text
+                rows = connection.execute(
+                    """SELECT number, is_keyframe, data FROM revisions
+                       WHERE note_id = ? AND number >= ? AND number <= coalesce(
+                           (SELECT min(number) FROM revisions
+                            WHERE note_id = ? AND number >= ? AND is_keyframe),
+                           (SELECT max(number) FROM revisions WHERE note_id = ?)
+                       )
+                       ORDER BY number DESC;
+                       """,
+                    (id, number, id, number, id),
+                ).fetchall()
+                current = connection.execute(
+                    "SELECT text, codec FROM notes WHERE id = ?;", (id,)
+                ).fetchone()
+            finally:
+                connection.execute("COMMIT;")
+
+        if not rows or rows[-1][0] != number or current is None:
+            return None
+
+        if rows[0][1]:
+            text = delta.unpack(rows[0][2])
+            rows = rows[1:]
+        else:
+            text = compression.decode(*current)
+
+        for _, _, data in rows:
+            text = delta.apply_delta(text, delta.unpack(data))
+        return text
+
+    @measured
+    def restore_revision(self, id, number):
+        """
+        Brings the text of a revision back. The replaced text becomes
+        a revision too, so restoring can be undone. Returns the text or None
+        """
+        text = self.get_revision_text(id, number)
+        if text is not None:
+            self.update_many({id: {"text": text}}, merge_revisions=False)
+        return text
+
+    def update_text(self, id, text):
+        return self.update_many({id: {"text": text}})
+
+    def update_texts(self, texts):
+        """ Updates texts of many notes, given as `{id: text}`, in one transaction """
+        return self.update_many({id: {"text": text} for id, text in texts.items()})
+
     def update_title(self, id, title):
-        self.db.execute(f'UPDATE notes SET title = "{title}" WHERE id = {id};')
-        self.connection.commit()
-        return self
+        return self.update_many({id: {"title": title}})
 
     def delete(self, id):
-        self.db.execute(f"DELETE FROM notes WHERE id = {id}")
-        self.connection.commit()
+        return self.delete_many([id])
+
+    @measured
+    def delete_many(self, ids):
+        """ Deletes notes with given IDs in one transaction """
+        with self.engine.write() as connection:
+            params = [(id,) for id in ids]
+            connection.executemany("DELETE FROM notes WHERE id = ?;", params)
+            connection.executemany("DELETE FROM revisions WHERE note_id = ?;", params)
+
+            # Deleted notes can be imported again
+            connection.executemany("DELETE FROM import_log WHERE note_id = ?;", params)
+        return self
+
+    def recompress(self, batch_size=100, on_progress=None):
+        """
+        Stores every text with the current compression settings: compresses
+        large texts, or decompresses them if compression is off.
+        Notes are rewritten in batches, each in its own transaction.
+        Texts are compressed outside of the write lock, so a note which
+        was saved meanwhile is left as it is, not overwritten with its old text.
+
+        :param on_progress: Called with the count of checked notes after every batch
+        :returns: Count of rewritten notes
+        """
+        last_id, checked, rewritten = 0, 0, 0
+        while True:
+            with self.engine.read() as connection:
+                rows = connection.execute(
+                    "SELECT id, text, codec, hash FROM notes WHERE id > ? ORDER BY id LIMIT ?;",
+                    (last_id, batch_size),
+                ).fetchall()
+            if not rows:
+                return rewritten
+
+            updates = []
+            for id, value, codec, text_hash in rows:
+                text = compression.decode(value, codec)
+                new_value, new_codec = compression.encode(text, *self.engine.compression)
+                if new_codec != codec:
+                    updates.append((new_value, new_codec, id, codec, text_hash))
+
+            # Keeps `updated_at`, texts don't change. Rows whose text or codec
+            # changed since they were read don't match and are skipped
+            with self.engine.write() as connection:
+                cursor = connection.executemany(
+                    """UPDATE notes SET text = ?, codec = ?
+                       WHERE id = ? AND codec = ? AND hash IS ?;
+                       """,
+                    updates,
+                )
+                rewritten += max(cursor.rowcount, 0)
+
+            last_id = rows[-1][0]
+            checked += len(rows)
+            if on_progress:
+                on_progress(checked)
+
+    def vacuum(self):
+        self.engine.vacuum()
+        return self
+
+    def get_stats(self):
+        """
+        Returns counts and sizes (in bytes) of notes and of the database,
+        for `notty stats`. `tables` maps every table to the sizes of its data
+        and indexes, it is None if SQLite is built without the `dbstat` table
+
+        Sizes of texts come from the `size` column, and the stored size of
+        compressed ones from the length of their blobs, which SQLite takes
+        from the row header, so texts are not read.
+        """
+        with self.engine.read() as connection:
+            count, compressed, total, stored, largest, revisions = connection.execute(
+                """SELECT count(*), total(codec != 0), total(size),
+                          total(CASE WHEN codec = 0 THEN size ELSE length(text) END), max(size),
+                          (SELECT count(*) FROM revisions)
+                   FROM notes;
+                   """
+            ).fetchone()
+            p99 = connection.execute(
+                "SELECT size FROM notes ORDER BY size LIMIT 1 OFFSET ?;",
+                (max(0, min(count - 1, int(count * 0.99))),),
+            ).fetchone()
+            page_size = connection.execute("PRAGMA page_size;").fetchone()[0]
+            free_pages = connection.execute("PRAGMA freelist_count;").fetchone()[0]
+            schema = {
+                name: (table, kind)
+                for name, table, kind in connection.execute(
+                    "SELECT name, tbl_name, type FROM sqlite_master;"
+                )
+            }
+
+            try:
+                pages = connection.execute(
+                    "SELECT name, sum(pgsize) FROM dbstat GROUP BY name;"
+                ).fetchall()
+            except sqlite3.OperationalError:
+                pages = None
+
+        tables = None
+        if pages is not None:
+            tables = {}
+            for name, size in pages:
+                table, kind = schema.get(name, (name, "table"))
+                # Shadow tables of the search index are shown as one table
+                if table.startswith("notes_fts"):
+                    table = "notes_fts"
+                sizes = tables.setdefault(table, {"data": 0, "indexes": 0})
+                sizes["indexes" if kind == "index" else "data"] += size
+
+        wal_path = self.path + "-wal"
+        return {
+            "notes": count,
+            "compressed": int(compressed),
+            "revisions": revisions,
+            "total_size": int(total),
+            "stored_size": int(stored),
+            "average_size": int(total / count) if count else 0,
+            "p99_size": p99[0] if p99 else 0,
+            "max_size": largest or 0,
+            "file_size": os.path.getsize(self.path),
+            "wal_size": os.path.getsize(wal_path) if os.path.exists(wal_path) else 0,
+            "free_size": free_pages * page_size,
+            "tables": tables,
+        }
+
+    def get_slow_queries(self, limit=10):
+        """ Returns the slowest of recently recorded slow queries, durations are in ms """
+        with self.engine.read() as connection:
+            rows = connection.execute(
+                """SELECT name, created_at, duration, rows FROM query_metrics
+                   ORDER BY duration DESC LIMIT ?;
+                   """,
+                (limit,),
+            ).fetchall()
+
+        return [dict(zip(("name", "created_at", "duration", "rows"), row)) for row in rows]
+
+    @measured
+    def get_imported(self, hashes):
+        """ Returns which of given content hashes were imported already """
+        hashes = list(hashes)
+        found = set()
+        with self.engine.read() as connection:
+            # Stay below SQLite's limit of bound parameters
+            for start in range(0, len(hashes), 500):
+                chunk = hashes[start : start + 500]
+                marks = ", ".join("?" * len(chunk))
+                found.update(
+                    row[0]
+                    for row in connection.execute(
+                        f"SELECT hash FROM import_log WHERE hash IN ({marks});", chunk
+                    )
+                )
+        return found
+
+    @measured
+    def log_imports(self, entries):
+        """ Records imported notes from `(hash, note_id, source)` """
+        with self.engine.write() as connection:
+            connection.executemany(
+                "INSERT OR IGNORE INTO import_log (hash, note_id, source) VALUES (?, ?, ?);",
+                entries,
+            )
         return self
 
     def close_conn(self):
-        return self.connection.close()
+        if self._engine:
+            return self._engine.close()
+        return close_engine()
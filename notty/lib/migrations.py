@@ -0,0 +1,315 @@
+"""
+    Versioned schema migrations.
+
+    The schema version of a database is kept in `PRAGMA user_version`.
+    Every migration runs once, in its own transaction together with
+    the version bump, so a crashed or interrupted migration leaves
+    the database at the previous version and is simply run again.
+
+    Migrations must tolerate schemas which were created before versioning
+    existed (`IF NOT EXISTS`, checking columns), and must go over notes
+    in batches so that large databases are migrated in bounded memory.
+"""
+
+from notty.utils import compression
+from notty.utils.metadata import describe
+from notty.utils.timestamps import parse_legacy_ts
+
+# Rows read and written at once by data migrations
+BATCH_SIZE = 1000
+
+# Sortable time columns of notes, both are indexed
+TIME_COLUMNS = ("created_at", "updated_at")
+
+
+def get_version(connection):
+    return connection.execute("PRAGMA user_version;").fetchone()[0]
+
+
+def get_columns(connection, table):
+    return [row[1] for row in connection.execute(f"PRAGMA table_info({table});")]
+
+
+def create_notes(connection):
+    """ Creates the notes table """
+    connection.execute(
+        """CREATE TABLE IF NOT EXISTS notes
+           (id INTEGER PRIMARY KEY AUTOINCREMENT, title text NOT_NULL, text text NOT_NULL, ts text NOT_NULL);
+           """
+    )
+
+
+def add_timestamps(connection):
+    """
+    Adds sortable `created_at` and `updated_at` epoch columns with indexes.
+
+    Existing notes get them from their locale-formatted `ts` strings.
+    A `ts` which can't be parsed takes the time of the previous note,
+    as IDs grow with time.
+    """
+    if "created_at" not in get_columns(connection, "notes"):
+        for column in TIME_COLUMNS:
+            connection.execute(f"ALTER TABLE notes ADD COLUMN {column} INTEGER;")
+
+    last_id, last_epoch = 0, 0
+    while True:
+        rows = connection.execute(
+            """SELECT id, ts FROM notes WHERE created_at IS NULL AND id > ?
+               ORDER BY id LIMIT ?;
+               """,
+            (last_id, BATCH_SIZE),
+        ).fetchall()
+        if not rows:
+            break
+
+        updates = []
+        for id, ts in rows:
+            last_epoch = parse_legacy_ts(ts) or last_epoch
+            updates.append((last_epoch, last_epoch, id))
+        connection.executemany(
+            "UPDATE notes SET created_at = ?, updated_at = ? WHERE id = ?;", updates
+        )
+        last_id = rows[-1][0]
+
+    for column in TIME_COLUMNS:
+        connection.execute(f"CREATE INDEX IF NOT EXISTS notes_{column} ON notes ({column});")
+
+
+def add_search_index(connection):
+    """
+    Creates the full-text search index over notes' titles and texts.
+
+    The index is kept in sync by triggers. Notes which existed before
+    the index was created are indexed in the background by the engine,
+    and `notes_fts_state` tracks how far it got: triggers only touch
+    notes which are already indexed.
+    """
+    exists = connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'notes_fts';").fetchone()
+    if exists:
+        return
+
+    connection.execute(
+        """CREATE VIRTUAL TABLE notes_fts USING fts5
+           (title, text, content='notes', content_rowid='id', prefix='2 3');
+           """
+    )
+    connection.execute(
+        """CREATE TABLE notes_fts_state
+           (indexed_upto INTEGER NOT NULL, backfill_until INTEGER NOT NULL);
+           """
+    )
+    connection.execute("INSERT INTO notes_fts_state SELECT 0, coalesce(max(id), 0) FROM notes;")
+
+    is_indexed = """(old.id > (SELECT backfill_until FROM notes_fts_state)
+        OR old.id <= (SELECT indexed_upto FROM notes_fts_state))"""
+    connection.execute(
+        """CREATE TRIGGER notes_fts_insert AFTER INSERT ON notes BEGIN
+               INSERT INTO notes_fts (rowid, title, text) VALUES (new.id, new.title, new.text);
+           END;
+           """
+    )
+    connection.execute(
+        f"""CREATE TRIGGER notes_fts_delete AFTER DELETE ON notes WHEN {is_indexed} BEGIN
+               INSERT INTO notes_fts (notes_fts, rowid, title, text)
+                   VALUES ('delete', old.id, old.title, old.text);
+           END;
+           """
+    )
+    connection.execute(
+        f"""CREATE TRIGGER notes_fts_update AFTER UPDATE OF title, text ON notes
+           WHEN {is_indexed} BEGIN
+               INSERT INTO notes_fts (notes_fts, rowid, title, text)
+                   VALUES ('delete', old.id, old.title, old.text);
+               INSERT INTO notes_fts (rowid, title, text) VALUES (new.id, new.title, new.text);
+           END;
+           """
+    )
+
+
+def add_import_log(connection):
+    """ Creates the log of imported notes, which dedups and resumes imports """
+    connection.execute(
+        """CREATE TABLE IF NOT EXISTS import_log
+           (hash TEXT PRIMARY KEY, note_id INTEGER NOT NULL, source TEXT) WITHOUT ROWID;
+           """
+    )
+
+
+def add_compression(connection):
+    """
+    Adds the `codec` column of notes, texts of rows with a codec are compressed.
+
+    The search index can't read compressed texts from notes anymore,
+    so it is recreated over `notes_plain`, a view decompressing texts with
+    the `notty_text()` function every connection has. The new index is
+    filled in the background, like the first one was.
+    """
+    if "codec" not in get_columns(connection, "notes"):
+        connection.execute("ALTER TABLE notes ADD COLUMN codec INTEGER NOT NULL DEFAULT 0;")
+
+    for trigger in ("notes_fts_insert", "notes_fts_delete", "notes_fts_update"):
+        connection.execute(f"DROP TRIGGER IF EXISTS {trigger};")
+    connection.execute("DROP TABLE IF EXISTS notes_fts;")
+    connection.execute("DROP TABLE IF EXISTS notes_fts_state;")
+
+    connection.execute(
+        """CREATE VIEW IF NOT EXISTS notes_plain AS
+           SELECT id, title, notty_text(text, codec) AS text FROM notes;
+           """
+    )
+    connection.execute(
+        """CREATE VIRTUAL TABLE notes_fts USING fts5
+           (title, text, content='notes_plain', content_rowid='id', prefix='2 3');
+           """
+    )
+    connection.execute(
+        """CREATE TABLE notes_fts_state
+           (indexed_upto INTEGER NOT NULL, backfill_until INTEGER NOT NULL);
+           """
+    )
+    connection.execute("INSERT INTO notes_fts_state SELECT 0, coalesce(max(id), 0) FROM notes;")
+
+    is_indexed = """(old.id > (SELECT backfill_until FROM notes_fts_state)
+        OR old.id <= (SELECT indexed_upto FROM notes_fts_state))"""
+    connection.execute(
+        """CREATE TRIGGER notes_fts_insert AFTER INSERT ON notes BEGIN
+               INSERT INTO notes_fts (rowid, title, text)
+                   VALUES (new.id, new.title, notty_text(new.text, new.codec));
+           END;
+           """
+    )
+    connection.execute(
+        f"""CREATE TRIGGER notes_fts_delete AFTER DELETE ON notes WHEN {is_indexed} BEGIN
+               INSERT INTO notes_fts (notes_fts, rowid, title, text)
+                   VALUES ('delete', old.id, old.title, notty_text(old.text, old.codec));
+           END;
+           """
+    )
+    # Rows which are only recompressed keep their index entries
+    is_changed = """(old.title IS NOT new.title
+        OR notty_text(old.text, old.codec) IS NOT notty_text(new.text, new.codec))"""
+    connection.execute(
+        f"""CREATE TRIGGER notes_fts_update AFTER UPDATE OF title, text ON notes
+           WHEN {is_indexed} AND {is_changed} BEGIN
+               INSERT INTO notes_fts (notes_fts, rowid, title, text)
+                   VALUES ('delete', old.id, old.title, notty_text(old.text, old.codec));
+               INSERT INTO notes_fts (rowid, title, text)
+                   VALUES (new.id, new.title, notty_text(new.text, new.codec));
+           END;
+           """
+    )
+
+
+def add_revisions(connection):
+    """ Creates the revision log of notes' texts """
+    connection.execute(
+        """CREATE TABLE IF NOT EXISTS revisions
+           (id INTEGER PRIMARY KEY, note_id INTEGER NOT NULL, number INTEGER NOT NULL,
+            created_at INTEGER NOT NULL, is_keyframe INTEGER NOT NULL, size INTEGER NOT NULL,
+            data BLOB NOT NULL);
+           """
+    )
+    connection.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS revisions_note ON revisions (note_id, number);"
+    )
+
+
+def add_query_metrics(connection):
+    """ Creates the rolling log of slow queries shown by `notty stats` """
+    connection.execute(
+        """CREATE TABLE IF NOT EXISTS query_metrics
+           (id INTEGER PRIMARY KEY, name TEXT NOT NULL, created_at INTEGER NOT NULL,
+            duration REAL NOT NULL, rows INTEGER NOT NULL);
+           """
+    )
+
+
+def add_metadata(connection):
+    """
+    Adds columns derived from notes' texts: `preview`, `size` (in bytes),
+    `lines`, `words` and the content `hash`. `Notes` keeps them up to date
+    on every write, so listings never read texts.
+
+    Existing notes are described in batches, a NULL `hash` marks notes
+    which are not described yet.
+    """
+    if "hash" not in get_columns(connection, "notes"):
+        connection.execute("ALTER TABLE notes ADD COLUMN preview TEXT NOT NULL DEFAULT '';")
+        for column in ("size", "lines", "words"):
+            connection.execute(f"ALTER TABLE notes ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0;")
+        connection.execute("ALTER TABLE notes ADD COLUMN hash TEXT;")
+
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            """SELECT id, text, codec FROM notes WHERE hash IS NULL AND id > ?
+               ORDER BY id LIMIT ?;
+               """,
+            (last_id, BATCH_SIZE),
+        ).fetchall()
+        if not rows:
+            break
+
+        connection.executemany(
+            """UPDATE notes SET preview = ?, size = ?, lines = ?, words = ?, hash = ?
+               WHERE id = ?;
+               """,
+            [describe(compression.decode(text, codec)) + (id,) for id, text, codec in rows],
+        )
+        last_id = rows[-1][0]
+
+
+def add_import_log_note_index(connection):
+    """
+    Indexes the import log by note, so deleting notes deletes their entries
+    and a deleted note can be imported again. Entries of notes deleted
+    before are dropped
+    """
+    connection.execute(
+        "CREATE INDEX IF NOT EXISTS import_log_note ON import_log (note_id);"
+    )
+    connection.execute("DELETE FROM import_log WHERE note_id NOT IN (SELECT id FROM notes);")
+
+
+# Migrations in order, a database at version N has the first N applied.
+# Append new migrations to the end, never reorder or remove them.
+MIGRATIONS = [
+    create_notes,
+    add_timestamps,
+    add_search_index,
+    add_import_log,
+    add_compression,
+    add_revisions,
+    add_query_metrics,
+    add_metadata,
+    add_import_log_note_index,
+]
+
+LATEST_VERSION = len(MIGRATIONS)
+
+
+def migrate(engine):
+    """ Applies migrations the database doesn't have yet, returns their count """
+    with engine.read() as connection:
+        version = get_version(connection)
+
+    if version > LATEST_VERSION:
+        raise RuntimeError(
+            f"Database {engine.path} has schema version {version}, "
+            f"but this version of notty supports up to {LATEST_VERSION}. Please update notty"
+        )
+
+    for number in range(version + 1, LATEST_VERSION + 1):
+        with engine.write() as connection:
+            # Another process could have migrated the DB in the meantime
+            if get_version(connection) >= number:
+                continue
+
+            MIGRATIONS[number - 1](connection)
+            connection.execute(f"PRAGMA user_version = {number};")
+
+    applied = LATEST_VERSION - version
+    if applied:
+        # Data migrations rewrite whole tables, don't leave a WAL of the same size behind
+        engine.checkpoint()
+    return applied
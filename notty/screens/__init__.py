@@ -1,2 +1,30 @@
-import notty.screens.create
-import notty.screens.list
\ No newline at end of file
+"""
+    Deferred screens registry.
+
+    Every screen builds its whole layout (and queries the database) when its
+    module is imported, so screens are imported only when a command runs them.
+"""
+
+import importlib
+
+SCREENS = {
+    "create": "notty.screens.create",
+    "list": "notty.screens.list",
+}
+
+
+def load(name):
+    """ Imports (and therefore builds) the screen with a given name """
+    return importlib.import_module(SCREENS[name])
+
+
+def execute(name, *args, **kwargs):
+    """ Builds the screen with a given name and runs it """
+    return load(name).execute(*args, **kwargs)
+
+
+def __getattr__(name):
+    # Keeps `screens.list.execute()` style access working without eager imports
+    if name in SCREENS:
+        return load(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
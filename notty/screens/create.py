@@ -4,6 +4,8 @@ from prompt_toolkit.layout import Layout
 from prompt_toolkit.widgets import TextArea, Button
 from prompt_toolkit.shortcuts import prompt
 from prompt_toolkit.layout.controls import FormattedTextControl
+from prompt_toolkit.layout.margins import ConditionalMargin, NumberedMargin, ScrollbarMargin
+from prompt_toolkit.filters import Condition
 from prompt_toolkit.formatted_text import HTML
 from prompt_toolkit.application.current import get_app
 from prompt_toolkit.layout.containers import (
@@ -15,13 +17,15 @@ from prompt_toolkit.layout.containers import (
     FloatContainer,
 )
 from notty.lib.db import Notes
+from notty.lib.AsyncNotes import AsyncNotes
+from notty.utils import tracing
+from notty.lib.LargeTextControl import is_large
 from notty.utils.date_now import date_now
 from colorama import Fore, Style
 from prompt_toolkit.styles import Style as PromptStyle
 from notty.lib.TextInputDialog import TextInputDialog
 from notty.lib.ConfirmationDialog import ConfirmationDialog
 from notty.lib.MessageDialog import MessageDialog
-from notty.lib.db import Notes
 import asyncio
 
 RS = Style.RESET_ALL
@@ -45,12 +49,17 @@ class ApplicationState:
         self.notification_text = HTML(
             f'<style bg="white" color="black">[ {message} ]</style>'
         )
+        get_app().invalidate()
         await asyncio.sleep(timeout)
         self.notification_text = None
+        get_app().invalidate()
 
 
 db = Notes()
 state = ApplicationState()
+
+# Writes the note off the event loop, slow saves are shown in the title bar
+async_db = AsyncNotes(db, on_busy_change=lambda: get_app().invalidate())
 style = PromptStyle.from_dict(
     {
         "dim": "#444",
@@ -71,6 +80,7 @@ def abort():
         print()
 
         try:
+            async_db.close()
             db.close_conn()
         except Exception as e:
             exception = Exception(f"Exception occurred on exiting: {e}")
@@ -88,12 +98,14 @@ async def show_dialog_as_float(dialog):
     focused_before = app.layout.current_window
     app.layout.focus(dialog)
     state.is_float_displaying = True
+    app.invalidate()
     result = await dialog.future
     state.is_float_displaying = False
     app.layout.focus(focused_before)
 
     if float_ in root_container.floats:
         root_container.floats.remove(float_)
+    app.invalidate()
 
     return result
 
@@ -103,7 +115,36 @@ def get_topbar_text():
 
 
 def get_statusbar_upper_text():
-    return state.notification_text or state.title
+    busy = f"{async_db.busy.capitalize()}..." if async_db.busy else None
+    return state.notification_text or busy or state.title
+
+
+def write_note(text):
+    """
+    Writes the note, the first save inserts it. Runs on the writer thread
+    of `async_db`, so saves are written one after another and the note
+    is inserted only once
+    """
+    if state.note_id:
+        db.update_text(state.note_id, text)
+    else:
+        state.note_id = db.insert((state.title, text, NOW))
+
+
+async def save_note(text):
+    """
+    Writes the note off the event loop, returns False and shows why if it failed.
+    The note stays unsaved if it was changed while it was written
+    """
+    try:
+        await async_db.run("saving", write_note, text)
+    except Exception as error:
+        state.is_saved = False
+        asyncio.ensure_future(state.show_notification(f"Couldn't save the note ({error})", 3))
+        return False
+
+    state.is_saved = text_window.text == text
+    return True
 
 
 def get_statusbar_right_text():
@@ -127,9 +168,14 @@ text_window = TextArea(
     multiline=True,
     wrap_lines=True,
     focusable=True,
-    scrollbar=True,
-    line_numbers=True,
 )
+
+# Margins slow down every key press in a large text, so they are hidden for it
+has_margins = Condition(lambda: not is_large(text_window.text))
+text_window.window.left_margins = [ConditionalMargin(NumberedMargin(), filter=has_margins)]
+text_window.window.right_margins = [
+    ConditionalMargin(ScrollbarMargin(display_arrows=True), filter=has_margins)
+]
 title_bar = Window(
     FormattedTextControl(get_statusbar_upper_text),
     align=WindowAlign.CENTER,
@@ -171,11 +217,13 @@ def _(event):
         current_text = text_window.text
 
         def save_handler(s):
-            if state.note_id:
-                db.update_text(state.note_id, current_text)
-            else:
-                db.insert((state.title, current_text, NOW))
-            s.future.set_result(True)
+            async def save():
+                # The dialog stays open if the note couldn't be written
+                saved = await save_note(current_text)
+                if not s.future.done():
+                    s.future.set_result(saved)
+
+            asyncio.ensure_future(save())
 
         if not state.is_saved:
             dialog = ConfirmationDialog(
@@ -209,14 +257,11 @@ def _(event):
     if state.is_saved:
         return False
 
-    if state.note_id:
-        db.update_text(state.note_id, text_window.text)
-    else:
-        db.insert((state.title, text_window.text, NOW))
-        state.note_id = db.db.lastrowid
+    async def coroutine():
+        if await save_note(text_window.text):
+            asyncio.ensure_future(state.show_notification("Saved the note", 1.5))
 
-    state.is_saved = True
-    asyncio.create_task(state.show_notification("Saved the note", 1.5))
+    asyncio.ensure_future(coroutine())
 
 
 @kb.add("c-r", eager=True)
@@ -255,12 +300,12 @@ application = Application(
     full_screen=True,
     erase_when_done=False,
     style=style,
-    refresh_interval=0.5,
 )
 
 
 def execute():
     async def main():
+        tracing.trace_application(application)
         return await application.run_async()
 
     return asyncio.run(main())
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 from prompt_toolkit.application import Application
 from prompt_toolkit.buffer import Buffer
+from prompt_toolkit.document import Document
 from prompt_toolkit.key_binding import (
     KeyBindings,
     merge_key_bindings,
@@ -17,8 +18,14 @@ from prompt_toolkit.layout.containers import (
     Float,
     FloatContainer,
 )
-from prompt_toolkit.layout.controls import BufferControl, FormattedTextControl
+from prompt_toolkit.layout.controls import (
+    BufferControl,
+    FormattedTextControl,
+    UIControl,
+    UIContent,
+)
 from prompt_toolkit.layout import ConditionalContainer
+from prompt_toolkit.layout.margins import ConditionalMargin, NumberedMargin, ScrollbarMargin
 from prompt_toolkit.key_binding.key_processor import KeyPressEvent
 from prompt_toolkit.formatted_text import HTML, ANSI
 from prompt_toolkit.layout.layout import Layout
@@ -29,20 +36,36 @@ from prompt_toolkit.utils import Event
 from prompt_toolkit.widgets.base import Border
 from prompt_toolkit.widgets import TextArea, SearchToolbar
 from prompt_toolkit.application.current import get_app
-from prompt_toolkit.filters import Condition
+from prompt_toolkit.filters import Condition, has_focus
+from prompt_toolkit.data_structures import Point
+from prompt_toolkit.mouse_events import MouseEvent, MouseEventType
 from colorama import Fore, Style
 from notty.lib.db import Notes
+from notty.lib.AsyncNotes import AsyncNotes
+from notty.utils import tracing
+from notty.lib.Note import NoteSummary
+from notty.lib.NoteList import NoteList
+from notty.lib.FuzzyFilter import FuzzyFilter
+from notty.lib.SaveQueue import RETRY_DELAY, SaveQueue
+from notty.lib.TextCache import TextCache
 from notty.lib.MessageDialog import MessageDialog
 from notty.lib.TextInputDialog import TextInputDialog
 from notty.lib.ConfirmationDialog import ConfirmationDialog
+from notty.lib.ChoiceDialog import ChoiceDialog
+from notty.lib.LargeTextControl import LargeTextControl, is_large
+from notty.utils.content_hash import content_hash
 from notty.utils.date_now import date_now
+from notty.utils.format_size import format_size
+from notty.utils.timestamps import epoch_now, format_epoch
 from notty.utils.if_mousedown import if_mousedown
 import asyncio
-import threading
+import time
 
 
 MAX_TITLE_LENGTH = 36
-SAVING_INTERVAL = 60  # Once a minute
+SAVE_DEBOUNCE = 1  # Seconds after the last change before it is saved
+PREFETCH_DISTANCE = 50  # Notes loaded ahead of the selected one
+PREFETCH_NEIGHBORS = 5  # Texts prefetched above and below the selected note
 
 
 class ApplicationState:
@@ -59,6 +82,39 @@ class ApplicationState:
     """ Current note text """
     current_text = ""
 
+    """ Content hash of the current note's text as it is stored in DB """
+    current_hash = None
+
+    """ Size, lines and words of the current note's text as it is stored in DB """
+    current_metadata = None
+
+    """
+    State which describes if the text window is being filled with a note
+    Needed for telling user's edits apart from switching notes
+    """
+    is_loading_note = False
+
+    """ State which describes if the current note's text is too large for the margins """
+    is_large_text = False
+
+    """
+    State which describes if the current large note is shown by the viewer
+    Its text is loaded into the text window only when the user starts editing it
+    """
+    is_large_note = False
+
+    """
+    State which describes if the current note's text is being loaded in the background
+    The text window is read-only until it's shown
+    """
+    is_loading_text = False
+
+    """ Fuzzy filter of notes' titles, set while the filter box is shown """
+    fuzzy_filter = None
+
+    """ Scheduled step of the fuzzy filter """
+    _filter_job = None
+
     """ Current focused window """
     focused_window = None
 
@@ -74,8 +130,6 @@ class ApplicationState:
     """
     is_float_displaying = False
 
-    _save_job_timer = None
-
     async def show_notification(self, message: str, timeout: int):
         """
         Shows notification in the reserved space for `timeout` and then hides
@@ -84,13 +138,18 @@ class ApplicationState:
         :param timeout: Timeout
         """
         self.notification_text = HTML(f'<style bg="white">[ {message} ]</style>')
+        get_app().invalidate()
         await asyncio.sleep(timeout)
         self.notification_text = ""
+        get_app().invalidate()
 
 
 # Database class
 db = Notes()
 
+# Runs queries of key handlers off the event loop, slow ones are shown in the status bar
+async_db = AsyncNotes(db, on_busy_change=lambda: get_app().invalidate())
+
 # Useful borders. Used in Layout
 borders = Border()
 
@@ -103,8 +162,22 @@ focus_bindings = KeyBindings()
 # Global keybindings
 kb = KeyBindings()
 
-# All stored notes
-notes = list(reversed(db.get_all()))
+# Key bindings for the filter box
+filter_bindings = KeyBindings()
+
+# Summaries of the stored notes, loaded page by page
+notes = NoteList(db)
+
+# Writes notes' texts in the background
+saver = SaveQueue(
+    async_db,
+    debounce=SAVE_DEBOUNCE,
+    on_saved=lambda saved: on_notes_saved(saved),
+    on_error=lambda error: on_save_failed(error),
+)
+
+# Texts of recently shown notes and of the selection's neighbors
+texts = TextCache(db)
 
 # Application state
 state = ApplicationState()
@@ -118,56 +191,121 @@ style = PromptStyle.from_dict(
         "sidebar.label selected": "#fff bold",
         "sidebar.label seldim": "bg:#444 #fff bold",
         "sidebar.modified": "bg:orange white bold",
+        "sidebar.marked": "bg:ansired #fff",
         "status": "reverse",
         "topbar": "bg:#fff bg:blue",
         "notification": "#000",
+        "filter": "bg:#444 #fff",
     }
 )
 
 # Text editor
 text_window = TextArea(
     text=state.current_text,
-    scrollbar=True,
-    line_numbers=True,
     multiline=True,
     width=Dimension(min=24),
     focus_on_click=True,
+    read_only=Condition(lambda: state.is_loading_text),
+)
+
+# Margins slow down every key press in a large text, so they are hidden for it
+has_margins = Condition(lambda: not state.is_large_text)
+text_window.window.left_margins = [ConditionalMargin(NumberedMargin(), filter=has_margins)]
+text_window.window.right_margins = [
+    ConditionalMargin(ScrollbarMargin(display_arrows=True), filter=has_margins)
+]
+
+
+def edit_large_note():
+    """ Loads the large note shown by the viewer into the text window """
+    if not state.is_large_note:
+        return
+
+    text = viewer.text
+    try:
+        state.is_loading_note = True
+        text_window.document = Document(text, viewer.get_line_offset(viewer.cursor_line))
+    finally:
+        state.is_loading_note = False
+
+    state.is_large_note = False
+    state.focused_window = text_window
+    get_app().layout.focus(text_window)
+
+
+# Viewer of large notes, which renders only the visible lines
+viewer = LargeTextControl(on_edit=edit_large_note)
+viewer_window = Window(
+    content=viewer,
+    width=Dimension(min=24),
+    cursorline=True,
+    wrap_lines=False,
 )
 
 
 def save_current_note():
-    """ Save the current note """
+    """ Save the current note if its text was modified """
+    if not state.current_note or not state.current_note.is_modified:
+        return
+
     text = text_window.document.text or ""
+    text_hash = content_hash(text)
 
-    if not state.current_note:
+    if text_hash != state.current_hash or saver.is_pending(state.current_note.id):
+        # Written later by the save queue, which resets the modified state
+        saver.put(state.current_note.id, text)
         return
 
-    if state.current_note.get("_INSERT_FLAG"):
-        note_id = db.insert(
-            (state.current_note["title"], text, state.current_note["ts"])
-        )
+    state.current_hash = text_hash
+    notes.update(state.selected_option_index, is_modified=False)
 
-        # Assign a newly created ID to the note
-        state.current_note["id"] = note_id
-        notes[state.selected_option_index]["id"] = note_id
 
-        # Delete the custom flag
-        del state.current_note["_INSERT_FLAG"]
-    else:
-        db.update_text(state.current_note["id"], text)
+def on_notes_saved(saved):
+    """ Called by the save queue with `{id: text}` of the written notes """
+    for note_id, text in saved.items():
+        texts.put(note_id, text)
 
-    notes[state.selected_option_index]["text"] = text
-    pass
+        # The note was modified again while it was being written
+        if saver.is_pending(note_id):
+            continue
 
+        # The last flush runs when the app has stopped, nothing is shown anymore
+        if state.current_note and state.current_note.id == note_id and get_app().is_running:
+            asyncio.ensure_future(load_note(state.current_note))
+
+        index = notes.find(note_id)
+        if index is not None:
+            notes.update(index, is_modified=False)
+
+    # Saves finish in the background, not on a key press which redraws anyway
+    get_app().invalidate()
+
+
+def on_save_failed(error):
+    """ Called by the save queue when a write failed, it is tried again later """
+    message = f"Couldn't save notes ({error}), trying again in {RETRY_DELAY:g}s"
+    asyncio.ensure_future(state.show_notification(message, 3))
 
-def create_initial_note():
-    return {
-        "id": None,
-        "title": date_now(),
-        "text": "",
-        "ts": date_now(),
-        "_INSERT_FLAG": True,
-    }
+
+async def load_note(note, load_text=False, started=None):
+    """
+    Takes the hash and counts of a note's text from DB, so the text is not hashed,
+    and loads the text itself if `load_text`. Both are dropped if another
+    note was selected meanwhile
+    """
+    metadata = await async_db.get_metadata(note.id)
+    text = (await async_db.get_text(note.id) or "") if load_text else None
+    if state.current_note is not note:
+        return
+
+    state.current_metadata = metadata
+    state.current_hash = metadata["hash"] if metadata else None
+    if load_text:
+        texts.put(note.id, text)
+        state.is_loading_text = False
+        show_text(text)
+        tracing.add("switch note (loaded)", "ui", started, hits=texts.hits, misses=texts.misses)
+    get_app().invalidate()
 
 
 def show_help():
@@ -176,14 +314,22 @@ def show_help():
             "Key combinations:",
             "    F1 - show this text",
             "    F2 - rename the title of current note",
+            "    F3 - restore an earlier version of the current note",
             "    Ctrl-C - exit the application",
             "    Ctrl-N - create a new note",
             "    Ctrl-T - show time of a note's creation",
-            "    Ctrl-D - delete the current note",
+            "    Ctrl-O - sort notes by creation / last edit",
+            "    Ctrl-D - delete the current note or all marked notes",
+            "    Space - mark the selected note in the sidebar",
+            "    Ctrl-F - search notes (empty query shows all notes)",
+            "    / - filter notes by their titles, Esc closes the filter",
             "    Tab / Shift-Tab - focus next / previous window",
             "",
+            "Notes larger than 1 MB or 20000 lines are opened in a viewer,",
+            "focus it with Tab and press Enter to edit the note.",
+            "",
             "All dangerous operations shows a confirmation dialog.",
-            f"Notes are being saved in the interval of {SAVING_INTERVAL} seconds.",
+            f"Notes are being saved {saver.debounce:g} seconds after you stop typing.",
         ]
     )
     return show_message("Help", help)
@@ -204,13 +350,9 @@ def rename_current_note():
             return None
 
         new_title = new_title.strip()
-
-        # If no custom flag, then update the title directly in DB
-        # If the current note is located only in cache (notes List),
-        # then there wouldn't be any document to update (tl;dr; will cause an SQLite error)
-        if not state.current_note.get("_INSERT_FLAG"):
-            db.update_title(state.current_note["id"], new_title)
-        notes[state.selected_option_index]["title"] = new_title
+        note = state.current_note
+        notes.update(state.selected_option_index, title=new_title)
+        await async_db.update_title(note.id, new_title)
 
     if not state.current_note:
         return
@@ -226,16 +368,13 @@ def rename_current_note():
 @kb.add("c-x", eager=True)
 def _(event: KeyPressEvent):
     """ Exit the application """
-    state._save_job_timer.cancel()
     try:
         # Try saving current note if `state.current_note` is provided
-        # We do not try to save other notes, because they are already saved
-        # when user switches the current note
+        # We do not try to save other notes, because they are already queued
+        # when user switches the current note. The queue is flushed and
+        # the DB connection is closed when the application finishes
         if state.current_note:
             save_current_note()
-
-        # Try to close SQLite DB connection
-        db.close_conn()
     except Exception as e:
         exception = Exception(f"Exception occurred on exiting: {e}")
         return event.app.exit(exception=exception)
@@ -256,16 +395,66 @@ def _(event: KeyPressEvent):
     rename_current_note()
 
 
+@kb.add("f3", eager=True)
+def _(event: KeyPressEvent):
+    """ Restores an earlier version of the current note """
+
+    async def coroutine():
+        # History must include the latest edits
+        save_current_note()
+        if not await saver.try_flush():
+            return
+
+        note_id = state.current_note.id
+        revisions = await async_db.get_revisions(note_id)
+        if not revisions:
+            asyncio.ensure_future(state.show_notification("The note was never changed", 1.5))
+            return
+
+        dialog = ChoiceDialog(
+            title="History",
+            label_text="Versions of the note, newest first",
+            ok_text="Restore",
+            values=[
+                (
+                    revision["number"],
+                    f"{format_epoch(revision['created_at'])}  ({revision['size']} characters)",
+                )
+                for revision in revisions
+            ],
+        )
+        number = await show_dialog_as_float(dialog)
+
+        # Return if canceled or another note was selected meanwhile
+        if number is None or not state.current_note or state.current_note.id != note_id:
+            return
+
+        await async_db.restore_revision(note_id, number)
+        texts.discard(note_id)
+        if state.current_note and state.current_note.id == note_id:
+            update_text_window(state.selected_option_index)
+        asyncio.ensure_future(state.show_notification("Restored, F3 again to undo", 2))
+
+    if len(notes) != 0 and not state.is_float_displaying:
+        asyncio.ensure_future(coroutine())
+
+
 @kb.add("c-d", eager=True)
 def _(event: KeyPressEvent):
-    """ Deletes the current note """
+    """ Deletes the marked notes, or the current note if none are marked """
 
     async def coroutine():
+        indexes = [index for index, note in enumerate(notes) if note.is_marked]
+        if not indexes:
+            indexes = [state.selected_option_index]
+
         dialog = ConfirmationDialog(
             title="Delete",
             yes_text="Yes",
             no_text="Cancel",
-            text="Do you want to delete the note?",
+            text="Do you want to delete the note?"
+            if len(indexes) == 1
+            else f"Do you want to delete {len(indexes)} marked notes?",
         )
         result = await show_dialog_as_float(dialog)
 
@@ -273,25 +462,32 @@ def _(event: KeyPressEvent):
         if not result:
             return
 
-        # If the current note doesn't have a custom flag then it is in DB
-        # so we need to manually call .delete() method. In any way, #
-        # we should delete the note in cache
-        if not state.current_note.get("_INSERT_FLAG"):
-            db.delete(state.current_note.get("id"))
-        del notes[state.selected_option_index]
-
-        # Get updated current index
-        i = state.selected_option_index
+        # Notes are deleted from DB in one transaction and from the cache right away
+        ids = [notes[index].id for index in indexes]
+        for note_id in ids:
+            saver.discard(note_id)
+            texts.discard(note_id)
+
+        # The open filter would show deleted notes again on the next query
+        if state.fuzzy_filter:
+            state.fuzzy_filter.remove([notes[index] for index in indexes])
+        notes.remove(indexes)
+        deleted = asyncio.ensure_future(async_db.delete_many(ids))
+
+        # Keep the selection where the first deleted note was
+        i = min(indexes)
+        await notes.ensure_async(i, async_db)
         if len(notes) - 1 < i and len(notes) != 0:
-            i = i - 1
+            i = len(notes) - 1
         elif len(notes) == 0:
             state.current_note = None
-            return None
+            return await deleted
 
         update_text_window(i)
         state.selected_option_index = i
         state.focused_window = sidebar
         event.app.layout.focus(sidebar)
+        await deleted
 
     # Run coroutine
     if len(notes) != 0:
@@ -302,26 +498,72 @@ def _(event: KeyPressEvent):
 def _(event: KeyPressEvent):
     """ Show the time of note creation """
     if len(notes) != 0 and not state.is_float_displaying:
-        ts = state.current_note.get("ts")
+        ts = format_epoch(state.current_note.created_at)
         asyncio.ensure_future(state.show_notification(ts, 2))
 
 
+@kb.add("c-o", eager=True)
+def _(event: KeyPressEvent):
+    """ Toggle sorting notes by creation and by last edit """
+    if state.is_float_displaying or notes.query or state.fuzzy_filter:
+        return
+
+    save_current_note()
+    order = "updated" if notes.order == "created" else "created"
+    notes.reset(order=order)
+    state.selected_option_index = 0
+    update_text_window(0)
+
+    message = "Recently edited first" if order == "updated" else "Newest first"
+    asyncio.ensure_future(state.show_notification(message, 1.5))
+
+
+@kb.add("c-f", eager=True)
+def _(event: KeyPressEvent):
+    """ Search notes by their titles and texts """
+
+    async def coroutine():
+        dialog = TextInputDialog(title="Search", label_text="Empty query shows all notes")
+        query = await show_dialog_as_float(dialog)
+
+        # Return if canceled
+        if query is None:
+            return
+
+        save_current_note()
+        notes.reset(query=query.strip() or None)
+        state.selected_option_index = 0
+
+        if not await notes.ensure_async(0, async_db):
+            state.current_note = None
+            asyncio.ensure_future(state.show_notification("Nothing was found", 1.5))
+            return
+
+        update_text_window(0)
+        state.focused_window = sidebar
+        event.app.layout.focus(sidebar)
+
+    if not state.is_float_displaying:
+        asyncio.ensure_future(coroutine())
+
+
 @kb.add("c-n", eager=True)
 def _(event: KeyPressEvent):
     """ Create a new note """
     if state.is_float_displaying:
         return
 
-    initial_note = create_initial_note()
-    title, text, ts = initial_note["title"], initial_note["text"], initial_note["ts"]
-    note_id = db.insert((title, text, ts))
-    note = dict(id=note_id, title=title, text=text, ts=ts)
-    notes.insert(0, note)
+    async def coroutine():
+        title, now = date_now(), epoch_now()
+        note_id = await async_db.insert((title, "", date_now()))
+        notes.insert(0, NoteSummary(note_id, title, now, now))
 
-    update_text_window(0)
-    state.selected_option_index = 0
-    state.focused_window = text_window
-    event.app.layout.focus(text_window)
+        update_text_window(0)
+        state.selected_option_index = 0
+        state.focused_window = text_window
+        event.app.layout.focus(text_window)
+
+    asyncio.ensure_future(coroutine())
 
 
 @focus_bindings.add("tab", eager=True)
@@ -341,24 +583,22 @@ def _(event: KeyPressEvent):
 @kb.add("c-s")
 def _(e: KeyPressEvent):
     " Save manually "
-    if state.current_note and not state.is_float_displaying:
-        save_current_note()
-        asyncio.create_task(state.show_notification("Saved the note", 1.5))
-
-
-def save_job():
-    """ Save job """
-    state._save_job_timer = threading.Timer(SAVING_INTERVAL, save_job)
-    state._save_job_timer.start()
 
-    if state.current_note:
+    async def coroutine():
         save_current_note()
+        if await saver.try_flush():
+            await state.show_notification("Saved the note", 1.5)
+
+    if state.current_note and not state.is_float_displaying:
+        asyncio.ensure_future(coroutine())
 
 
 # Getters for windows' texts
 
 
 def get_titlebar_text():
+    if notes.query:
+        return [("class:bold", f"Notes matching: {notes.query}")]
     return [("class:bold", "Notes")]
 
 
@@ -366,8 +606,8 @@ def get_current_note_title():
     if not state.current_note:
         return ""
 
-    id = f"[{state.current_note.get('id')}] " if state.current_note.get("id") else ""
-    return id + state.current_note.get("title")
+    id = f"[{state.current_note.id}] " if state.current_note.id else ""
+    return id + state.current_note.title
 
 
 def get_notification_text():
@@ -383,24 +623,91 @@ def get_statusbar_text():
 
 
 def get_statusbar_right_text():
-    return (
-        " {}:{}  ".format(
-            text_window.document.cursor_position_row + 1,
-            text_window.document.cursor_position_col + 1,
-        )
-        if state.current_note
+    busy = " {}... ".format(async_db.busy.capitalize()) if async_db.busy else ""
+    if not state.current_note:
+        return busy
+
+    metadata = state.current_metadata
+    counts = (
+        " {}, {} words ".format(format_size(metadata["size"]), metadata["words"])
+        if metadata
         else ""
     )
+    if state.is_large_note:
+        return busy + counts + " {}/{}  ".format(viewer.cursor_line + 1, viewer.index.line_count)
+
+    return busy + counts + " {}:{}  ".format(
+        text_window.document.cursor_position_row + 1,
+        text_window.document.cursor_position_col + 1,
+    )
+
+
+def show_text(text):
+    """ Shows a text of the current note in the text window, or in the viewer if it's large """
+    try:
+        state.is_loading_note = True
+        state.is_large_text = state.is_large_note = is_large(text)
+        if state.is_large_note:
+            viewer.text = text
+            text_window.text = ""
+
+            if state.focused_window == text_window:
+                state.focused_window = viewer_window
+                get_app().layout.focus(viewer_window)
+        else:
+            viewer.text = ""
+            text_window.text = text
+    finally:
+        state.is_loading_note = False
 
 
 # Needed to be called `switch_note()`
 def update_text_window(i: int):
     """ Updates a text in text input window """
+    started = time.perf_counter()
     try:
-        state.current_note = notes[i]
-        text_window.text = notes[i].get("text")
-    except:
-        pass
+        note = notes[i]
+    except IndexError:
+        # There is no note at `i`, e.g. the list is empty
+        return
+    state.current_note = note
+
+    # Texts are loaded only when notes are selected, unless they are
+    # waiting to be saved or were cached or prefetched before
+    text, source = saver.get(note.id), "queued"
+    if text is None:
+        text, source = texts.get(note.id), "cached"
+
+    # Other texts are shown when they are loaded in the background
+    state.current_metadata = state.current_hash = None
+    asyncio.ensure_future(load_note(note, load_text=text is None, started=started))
+    if text is None:
+        text, source = "", None
+
+    state.is_loading_text = source is None
+    show_text(text)
+
+    # Summaries ahead are loaded in the background, so <down> finds them loaded
+    if i + PREFETCH_DISTANCE >= len(notes) and not notes.exhausted:
+        asyncio.ensure_future(notes.ensure_async(i + PREFETCH_DISTANCE, async_db))
+    neighbors = range(max(0, i - PREFETCH_NEIGHBORS), min(len(notes), i + PREFETCH_NEIGHBORS + 1))
+    texts.prefetch(notes[index].id for index in neighbors if index != i)
+    if source:
+        tracing.add(f"switch note ({source})", "ui", started, hits=texts.hits, misses=texts.misses)
+
+
+def on_text_change_handler(e: Buffer):
+    """ Marks the current note as modified """
+    if state.is_loading_note or not state.current_note:
+        return
+
+    if not state.current_note.is_modified:
+        notes.update(state.selected_option_index, is_modified=True)
+
+    saver.put(state.current_note.id, text_window.text)
+
+
+text_window.buffer.on_text_changed.add_handler(on_text_change_handler)
 
 
 def show_message(title, text):
@@ -423,90 +730,261 @@ async def show_dialog_as_float(dialog):
     focused_before = app.layout.current_window
     app.layout.focus(dialog)
     state.is_float_displaying = True
+    app.invalidate()
     result = await dialog.future
     state.is_float_displaying = False
     app.layout.focus(focused_before)
 
     if float_ in root_container.floats:
         root_container.floats.remove(float_)
+    app.invalidate()
 
     return result
 
 
-def create_sidebar():
+class SidebarControl(UIControl):
     """
-    Creates the `Layout` for the sidebar with the configurable options.
+    List of notes in the sidebar.
+
+    Only the visible lines are rendered, and the content is rebuilt only
+    when the notes list, the selection or the focus change.
     """
 
-    def get_text_fragments():
-        tokens = []  # List of tokens
-        handle = sidebar_bindings.add  # Shortcut for sidebar key bindings
-
-        def append(index, label, is_modified):
-            """ Appends new item to the tokens List """
-            # Current selected note state
-            selected = index == state.selected_option_index
-
-            @if_mousedown
-            def select_item(mouse_event):
-                """ Select item if it was clicked """
-                save_current_note()
-                state.selected_option_index = index
-                update_text_window(index)
-
-            @handle("up")
-            def _(event):
-                """ Handles <up> arrow key """
-                save_current_note()
-                if state.selected_option_index - 1 < 0:
-                    state.selected_option_index = len(notes) - 1
-                else:
-                    state.selected_option_index -= 1
-                update_text_window(state.selected_option_index)
-
-            @handle("down")
-            def _(event):
-                """ Handles <down> arrow key """
-                save_current_note()
-                if state.selected_option_index + 1 > len(notes) - 1:
-                    state.selected_option_index = 0
-                else:
-                    state.selected_option_index += 1
-                update_text_window(state.selected_option_index)
-
-            sel = (
-                ",selected"
-                if selected and state.focused_window == sidebar
-                else ",seldim"
-                if selected
-                else ""
-            )
-            spaces = MAX_TITLE_LENGTH - len(label)
+    def __init__(self):
+        self._content = None
+        self._content_key = None
+        self._lines = {}
 
-            tokens.append(
-                ("class:sidebar.label" + sel, f"{label}{' ' * spaces}", select_item)
-            )
+    def is_focusable(self):
+        return True
+
+    def preferred_width(self, max_available_width):
+        return MAX_TITLE_LENGTH
 
-            if selected:
-                tokens.append(("[SetCursorPosition]", ""))
+    def preferred_height(self, width, max_available_height, wrap_lines, get_line_prefix):
+        return len(notes)
 
-            tokens.append(("class:sidebar", "\n"))
+    def create_content(self, width, height):
+        key = (notes.version, state.selected_option_index, state.focused_window == sidebar)
 
-        i = 0
-        for note in notes:
-            append(
-                i,
-                note["title"]
-                if len(note["title"]) < 32
-                else note["title"][0 : (MAX_TITLE_LENGTH - 3)] + "...",
-                note.get("is_modified"),
+        if key != self._content_key:
+            self._content_key = key
+            self._lines = {}
+            self._content = UIContent(
+                get_line=self._get_line,
+                line_count=len(notes),
+                cursor_position=Point(x=0, y=state.selected_option_index),
+                show_cursor=False,
             )
-            i += 1
 
-        return tokens
+        return self._content
+
+    def _get_line(self, index):
+        if index not in self._lines:
+            self._lines[index] = self._render_line(index)
+        return self._lines[index]
+
+    def _render_line(self, index):
+        note = notes[index]
+        title = note.title
+        label = (
+            title
+            if len(title) < 32
+            else title[0 : (MAX_TITLE_LENGTH - 3)] + "..."
+        )
+
+        # Current selected note state
+        selected = index == state.selected_option_index
+        sel = (
+            ",selected"
+            if selected and state.focused_window == sidebar
+            else ",seldim"
+            if selected
+            else ""
+        )
+        spaces = MAX_TITLE_LENGTH - len(label)
+
+        # Notes with unsaved changes are highlighted
+        if note.is_modified:
+            sel += ",sidebar.modified"
+
+        # Notes marked for a bulk action
+        if note.is_marked:
+            sel += ",sidebar.marked"
 
+        return [("class:sidebar.label" + sel, f"{label}{' ' * spaces}")]
+
+    def mouse_handler(self, mouse_event: MouseEvent):
+        """ Select item if it was clicked """
+        if mouse_event.event_type != MouseEventType.MOUSE_DOWN:
+            return NotImplemented
+
+        index = mouse_event.position.y
+        if index < len(notes):
+            select_note(index)
+
+
+def select_note(index: int):
+    """ Saves the current note and switches to the note at `index` """
+    save_current_note()
+    state.selected_option_index = index
+    update_text_window(index)
+
+
+def select_note_at(index: int, otherwise: int = None):
+    """
+    Selects the note at `index`, or at `otherwise` if there are fewer notes.
+    Notes which are not loaded yet are loaded in the background first,
+    the selection is kept if it was moved meanwhile
+    """
+    selected = state.selected_option_index
+
+    def select():
+        if index < len(notes):
+            select_note(index)
+        elif otherwise is not None:
+            select_note(otherwise)
+
+    async def coroutine():
+        await notes.ensure_async(index, async_db)
+        if state.selected_option_index == selected:
+            select()
+
+    if index < len(notes) or notes.exhausted:
+        select()
+    else:
+        asyncio.ensure_future(coroutine())
+
+
+@sidebar_bindings.add("up")
+def _(event: KeyPressEvent):
+    """ Handles <up> arrow key """
+    if state.selected_option_index - 1 >= 0:
+        select_note(state.selected_option_index - 1)
+        return
+
+    async def coroutine():
+        await notes.ensure_all_async(async_db)
+        if state.selected_option_index == 0:
+            select_note(len(notes) - 1)
+
+    asyncio.ensure_future(coroutine())
+
+
+@sidebar_bindings.add("down")
+def _(event: KeyPressEvent):
+    """ Handles <down> arrow key """
+    select_note_at(state.selected_option_index + 1, otherwise=0)
+
+
+@sidebar_bindings.add("space")
+def _(event: KeyPressEvent):
+    """ Marks or unmarks the selected note and moves to the next one """
+    if len(notes) == 0:
+        return
+
+    index = state.selected_option_index
+    notes.update(index, is_marked=not notes[index].is_marked)
+    select_note_at(index + 1)
+
+
+@sidebar_bindings.add("/")
+def _(event: KeyPressEvent):
+    """ Opens the filter box """
+    save_current_note()
+
+    async def coroutine():
+        # Every note's summary is needed to filter them as the query is typed
+        state.fuzzy_filter = FuzzyFilter(await async_db.get_page(limit=-1))
+        filter_box.text = ""
+        state.focused_window = filter_box
+        event.app.layout.focus(filter_box)
+
+    asyncio.ensure_future(coroutine())
+
+
+@filter_bindings.add("escape", eager=True)
+def _(event: KeyPressEvent):
+    """ Closes the filter box and shows all notes again """
+    if state._filter_job:
+        state._filter_job.cancel()
+    state.fuzzy_filter = None
+
+    save_current_note()
+    notes.reset()
+    state.selected_option_index = 0
+    update_text_window(0)
+
+    if state.current_note:
+        state.focused_window = sidebar
+        event.app.layout.focus(sidebar)
+
+
+@filter_bindings.add("enter")
+def _(event: KeyPressEvent):
+    """ Focuses the filtered notes """
+    if state.current_note:
+        state.focused_window = sidebar
+        event.app.layout.focus(sidebar)
+
+
+@filter_bindings.add("up")
+@filter_bindings.add("down")
+def _(event: KeyPressEvent):
+    """ Moves through the filtered notes without leaving the filter box """
+    index = state.selected_option_index + (1 if event.key_sequence[0].key == "down" else -1)
+    if 0 <= index < len(notes):
+        select_note(index)
+
+
+def run_filter_step():
+    """ Matches the filter query for a part of a frame and shows the results """
+    fuzzy = state.fuzzy_filter
+    if not fuzzy:
+        return
+
+    done = fuzzy.step()
+    notes.show(fuzzy.matched_items())
+
+    if len(notes) == 0:
+        save_current_note()
+        state.current_note = None
+    elif not state.current_note or state.current_note.id != notes[0].id:
+        select_note(0)
+    state.selected_option_index = 0
+
+    # The rest is matched in the next iterations of the event loop,
+    # so key presses are handled in between
+    state._filter_job = None if done else asyncio.get_event_loop().call_soon(run_filter_step)
+    get_app().invalidate()
+
+
+def on_filter_change_handler(e: Buffer):
+    """ Starts matching the new filter query """
+    if not state.fuzzy_filter:
+        return
+
+    if state._filter_job:
+        state._filter_job.cancel()
+    state.fuzzy_filter.set_query(filter_box.text)
+    run_filter_step()
+
+
+filter_box = TextArea(
+    multiline=False,
+    prompt="Filter: ",
+    style="class:filter",
+    height=1,
+)
+filter_box.buffer.on_text_changed.add_handler(on_filter_change_handler)
+
+
+def create_sidebar():
+    """
+    Creates the `Layout` for the sidebar with the configurable options.
+    """
     return Window(
-        content=FormattedTextControl(get_text_fragments, focusable=True),
+        content=SidebarControl(),
         style="class:sidebar",
         width=Dimension(max=36, min=16, preferred=36),
         height=Dimension(min=3),
@@ -530,12 +1008,24 @@ main_window = VSplit(
     [
         sidebar,
         Window(width=2, char=f"{borders.VERTICAL} ", style="class:line"),
-        text_window,
+        HSplit(
+            [
+                ConditionalContainer(
+                    text_window, filter=Condition(lambda: not state.is_large_note)
+                ),
+                ConditionalContainer(
+                    viewer_window, filter=Condition(lambda: state.is_large_note)
+                ),
+            ]
+        ),
     ]
 )
 
 body = HSplit(
     [
+        ConditionalContainer(
+            filter_box, filter=Condition(lambda: state.fuzzy_filter is not None)
+        ),
         ConditionalContainer(main_window, filter=Condition(lambda: state.current_note)),
         ConditionalContainer(
             no_notes_text, filter=Condition(lambda: not state.current_note)
@@ -561,7 +1051,7 @@ body = HSplit(
                 Window(
                     FormattedTextControl(get_statusbar_right_text),
                     style="class:status.right, bold",
-                    width=9,
+                    width=Dimension(min=9),
                     align=WindowAlign.RIGHT,
                 ),
             ],
@@ -592,22 +1082,36 @@ application = Application(
             ),
             ConditionalKeyBindings(
                 key_bindings=sidebar_bindings,
-                filter=Condition(lambda: state.focused_window == sidebar),
+                filter=Condition(
+                    lambda: state.focused_window == sidebar and not state.is_float_displaying
+                ),
             ),
+            ConditionalKeyBindings(key_bindings=filter_bindings, filter=has_focus(filter_box)),
         ]
     ),
     mouse_support=True,
     full_screen=True,
     style=style,
-    refresh_interval=0.5,
 )
 
 
-def execute():
+def execute(debounce=SAVE_DEBOUNCE):
     async def main():
+        saver.debounce = debounce
+        tracing.trace_application(application)
         update_text_window(0)
         state.focused_window = sidebar
-        save_job()
-        return await application.run_async()
+
+        try:
+            return await application.run_async()
+        finally:
+            # Write pending saves before closing the DB connection,
+            # which is closed even if they can't be written
+            try:
+                await saver.close()
+            finally:
+                texts.close()
+                async_db.close()
+                db.close_conn()
 
     return asyncio.run(main())
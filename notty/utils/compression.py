@@ -0,0 +1,53 @@
+import lzma
+import os
+import zlib
+
+# Codecs of stored texts, IDs are kept in the `codec` column of notes
+CODECS = {"none": 0, "zlib": 1, "lzma": 2}
+
+# Texts shorter than this (in characters) are never compressed
+DEFAULT_THRESHOLD = 64 * 1024
+
+
+def get_settings():
+    """
+    Returns `(codec name, threshold)` from `NOTTY_COMPRESSION` and
+    `NOTTY_COMPRESSION_THRESHOLD`. Compression is off unless enabled
+    """
+    codec = os.environ.get("NOTTY_COMPRESSION", "none").strip().lower() or "none"
+    if codec not in CODECS:
+        raise ValueError(f"Unknown NOTTY_COMPRESSION {codec!r}, use one of: {', '.join(CODECS)}")
+
+    threshold = os.environ.get("NOTTY_COMPRESSION_THRESHOLD", str(DEFAULT_THRESHOLD))
+    try:
+        return codec, int(threshold)
+    except ValueError:
+        raise ValueError(f"NOTTY_COMPRESSION_THRESHOLD {threshold!r} is not a number of characters")
+
+
+def encode(text, codec="none", threshold=DEFAULT_THRESHOLD):
+    """ Returns `(value, codec ID)` to store a text with, compressed if it pays off """
+    if codec == "none" or text is None or len(text) < threshold:
+        return text, 0
+
+    data = text.encode("utf-8")
+    if codec == "zlib":
+        compressed = zlib.compress(data, 6)
+    else:
+        compressed = lzma.compress(data, preset=6)
+
+    # Incompressible texts stay as they are
+    if len(compressed) >= len(data):
+        return text, 0
+    return compressed, CODECS[codec]
+
+
+def decode(value, codec_id):
+    """ Returns the text of a stored value """
+    if not codec_id or value is None:
+        return value
+    if codec_id == CODECS["zlib"]:
+        return zlib.decompress(value).decode("utf-8")
+    if codec_id == CODECS["lzma"]:
+        return lzma.decompress(value).decode("utf-8")
+    raise ValueError(f"Unknown codec ID: {codec_id}")
@@ -0,0 +1,6 @@
+import hashlib
+
+
+def content_hash(text):
+    """Returns a short hex digest of the text, used to detect changes"""
+    return hashlib.blake2b((text or "").encode("utf-8"), digest_size=16).hexdigest()
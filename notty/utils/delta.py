@@ -0,0 +1,87 @@
+from difflib import SequenceMatcher
+import json
+import zlib
+
+
+# Lines compared at once when looking for unchanged lines around an edit
+COMPARE_CHUNK = 1024
+
+
+def common_prefix(a, b):
+    """ Count of equal leading items of two lists, compared chunk by chunk """
+    end = min(len(a), len(b))
+    start = 0
+    while start < end:
+        stop = min(start + COMPARE_CHUNK, end)
+        if a[start:stop] != b[start:stop]:
+            while a[start] == b[start]:
+                start += 1
+            return start
+        start = stop
+    return end
+
+
+def common_suffix(a, b, limit):
+    """ Count of equal trailing items of two lists, up to `limit` """
+    count = 0
+    while count < limit:
+        size = min(COMPARE_CHUNK, limit - count)
+        if a[len(a) - count - size : len(a) - count] != b[len(b) - count - size : len(b) - count]:
+            while a[len(a) - count - 1] == b[len(b) - count - 1]:
+                count += 1
+            return count
+        count += size
+    return limit
+
+
+def make_delta(base, target):
+    """
+    Returns a line-based delta which turns `base` into `target`.
+
+    The delta is a list of `[start, end]` ranges of `base` lines to copy
+    and strings to insert, so unchanged lines cost a few bytes. Lines
+    around the edited region are matched first, so only that region is
+    diffed and a small edit of a huge text stays cheap.
+    """
+    base_lines = base.splitlines(keepends=True)
+    target_lines = target.splitlines(keepends=True)
+
+    prefix = common_prefix(base_lines, target_lines)
+    suffix = common_suffix(
+        base_lines, target_lines, min(len(base_lines), len(target_lines)) - prefix
+    )
+    base_end, target_end = len(base_lines) - suffix, len(target_lines) - suffix
+
+    delta = [[0, prefix]] if prefix else []
+    matcher = SequenceMatcher(
+        None, base_lines[prefix:base_end], target_lines[prefix:target_end], autojunk=False
+    )
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            delta.append([prefix + i1, prefix + i2])
+        elif tag in ("replace", "insert"):
+            delta.append("".join(target_lines[prefix + j1 : prefix + j2]))
+    if suffix:
+        delta.append([base_end, len(base_lines)])
+    return delta
+
+
+def apply_delta(base, delta):
+    """ Returns the text a delta made by `make_delta()` produces from `base` """
+    base_lines = base.splitlines(keepends=True)
+    parts = []
+    for op in delta:
+        if isinstance(op, str):
+            parts.append(op)
+        else:
+            parts.extend(base_lines[op[0] : op[1]])
+    return "".join(parts)
+
+
+def pack(value):
+    """ Compresses a text or a delta for storing """
+    return zlib.compress(json.dumps(value, separators=(",", ":")).encode("utf-8"))
+
+
+def unpack(data):
+    return json.loads(zlib.decompress(data).decode("utf-8"))
@@ -0,0 +1,6 @@
+def format_size(size):
+    """Returns a size in bytes as a short human readable string"""
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if size < 1024 or unit == "GiB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
@@ -0,0 +1,28 @@
+from notty.utils.content_hash import content_hash
+
+# Characters of a note's text kept as its preview
+PREVIEW_LENGTH = 96
+
+# Characters split into words at once, so counting words of a huge text
+# doesn't build a list of all of them
+WORDS_CHUNK = 256 * 1024
+
+
+def count_words(text):
+    """Returns the count of whitespace-separated words in the text"""
+    words = 0
+    for start in range(0, len(text), WORDS_CHUNK):
+        chunk = text[start : start + WORDS_CHUNK]
+        words += len(chunk.split())
+        # A word cut by the chunk boundary was counted twice
+        if start and not chunk[0].isspace() and not text[start - 1].isspace():
+            words -= 1
+    return words
+
+
+def describe(text):
+    """Returns `(preview, size in bytes, lines, words, hash)` of a note's text"""
+    text = text or ""
+    size = len(text) if text.isascii() else len(text.encode("utf-8"))
+    lines = text.count("\n") + 1 if text else 0
+    return text[:PREVIEW_LENGTH], size, lines, count_words(text), content_hash(text)
@@ -0,0 +1,35 @@
+from datetime import datetime
+import time
+
+# Formats which `ts` strings of notes were written with, see `date_now()`
+LEGACY_FORMATS = ("%c", "%a %b %d %H:%M:%S %Y")
+
+
+def epoch_now():
+    """ Returns current time as integer seconds since the epoch """
+    return int(time.time())
+
+
+def format_epoch(epoch):
+    """ Formats seconds since the epoch as a local date, like `date_now()` """
+    return datetime.fromtimestamp(epoch or 0).strftime("%c")
+
+
+def parse_legacy_ts(ts):
+    """ Parses a `ts` string written by older versions, returns epoch or None """
+    for fmt in LEGACY_FORMATS:
+        try:
+            return int(time.mktime(datetime.strptime(ts.strip(), fmt).timetuple()))
+        except (ValueError, AttributeError, OverflowError):
+            continue
+    return None
+
+
+def parse_date(text):
+    """ Parses `YYYY-MM-DD[ HH:MM[:SS]]` in local time, returns epoch """
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return int(time.mktime(datetime.strptime(text.strip(), fmt).timetuple()))
+        except ValueError:
+            continue
+    raise ValueError(f"Unknown date format: {text}")
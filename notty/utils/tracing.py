@@ -0,0 +1,139 @@
+"""
+    Opt-in performance tracing, enabled by `notty --profile <file>` or
+    the `NOTTY_TRACE` environment variable.
+
+    Until `enable()` is called, applications are not hooked and spans are
+    dropped after a single check, so tracing costs nothing noticeable when
+    it is off. Spans are written as Chrome trace event JSON, which opens in
+    chrome://tracing and https://ui.perfetto.dev
+"""
+
+import json
+import os
+import threading
+import time
+
+# Environment variable with the path of the trace file
+TRACE_ENV = "NOTTY_TRACE"
+
+# Rows of the summary printed on exit
+SUMMARY_ROWS = 15
+
+_tracer = None
+
+
+class Tracer:
+    """ Collects complete ("X") trace events in memory until it is saved """
+
+    def __init__(self, path):
+        self.path = path
+        self.events = []
+        self._origin = time.perf_counter()
+        self._pid = os.getpid()
+
+    def add(self, name, category, started, finished=None, **args):
+        """ Records a span which started and finished at `time.perf_counter()` times """
+        if finished is None:
+            finished = time.perf_counter()
+
+        # Appending to a list is atomic, so spans can be added from worker threads
+        self.events.append(
+            {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": (started - self._origin) * 1e6,
+                "dur": (finished - started) * 1e6,
+                "pid": self._pid,
+                "tid": threading.get_ident(),
+                "args": args,
+            }
+        )
+
+    def save(self):
+        with open(self.path, "w", encoding="utf-8") as file:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, file)
+
+    def summary(self):
+        """ Returns a table of the spans' durations grouped by their names """
+        durations = {}
+        for event in self.events:
+            key = (event["cat"], event["name"])
+            durations.setdefault(key, []).append(event["dur"] / 1000)
+
+        rows = sorted(durations.items(), key=lambda item: -sum(item[1]))
+        lines = [
+            f"{'span':<32} {'count':>7} {'total ms':>10} {'mean':>8} {'p95':>8} {'max':>8}"
+        ]
+        for (category, name), values in rows[:SUMMARY_ROWS]:
+            values.sort()
+            p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+            lines.append(
+                f"{category + ': ' + name:<32.32} {len(values):>7} {sum(values):>10.1f} "
+                f"{sum(values) / len(values):>8.2f} {p95:>8.2f} {values[-1]:>8.2f}"
+            )
+        if len(rows) > SUMMARY_ROWS:
+            lines.append(f"... and {len(rows) - SUMMARY_ROWS} more in the trace file")
+        return "\n".join(lines)
+
+
+def enable(path):
+    """ Starts collecting spans to be written to `path` by `finish()` """
+    global _tracer
+    _tracer = Tracer(path)
+    return _tracer
+
+
+def is_enabled():
+    return _tracer is not None
+
+
+def add(name, category, started, finished=None, **args):
+    """ Records a span if tracing is enabled """
+    if _tracer is not None:
+        _tracer.add(name, category, started, finished, **args)
+
+
+def finish():
+    """ Writes the trace file and returns the summary, or None if tracing is off """
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is None:
+        return None
+
+    tracer.save()
+    return f"{tracer.summary()}\n\nTrace of {len(tracer.events)} spans is saved to {tracer.path}"
+
+
+def trace_application(application):
+    """
+    Records render time of every frame, time of dispatching every key press
+    and time from a key press to the redraw which shows its result
+    """
+    if _tracer is None:
+        return
+
+    state = {"render": None, "key": None, "pressed": []}
+
+    def before_render(app):
+        state["render"] = time.perf_counter()
+
+    def after_render(app):
+        finished = time.perf_counter()
+        if state["render"] is not None:
+            add("render", "ui", state["render"], finished)
+        for pressed in state["pressed"]:
+            add("key to redraw", "ui", pressed, finished)
+        state["pressed"] = []
+
+    def before_key_press(processor):
+        state["key"] = time.perf_counter()
+        state["pressed"].append(state["key"])
+
+    def after_key_press(processor):
+        add("key press", "ui", state["key"])
+
+    application.before_render += before_render
+    application.after_render += after_render
+    application.key_processor.before_key_press += before_key_press
+    application.key_processor.after_key_press += after_key_press